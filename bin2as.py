@@ -15,15 +15,30 @@
 # contained in the LICENSE.txt file.
 # ----------------------------------------------------------------------------
 import os
+import re
 import argparse
 
+def _parse_align(s: str) -> int:
+    """Parses an alignment, decimal (leading zeros allowed) or 0x hex"""
+    return int(s, 16) if s.lower().startswith('0x') else int(s, 10)
+
 parser = argparse.ArgumentParser()
-parser.add_argument('-i', type=str, required=True, help='Input file')
+parser.add_argument('-i', type=str, required=True, action='append',
+                    help='Input file. In bundle mode, may be given multiple times as [NAME=]FILE[@ALIGN]')
 parser.add_argument('-v', type=str, help='Variable name')
 parser.add_argument('-o', type=str, required=True, help='Output file')
+parser.add_argument('-b', action='store_true', help='Bundle mode: embed all inputs into one blob with a lookup table')
+parser.add_argument('-a', type=_parse_align, default=8, help='Default alignment of each blob in bundle mode, in bytes')
+parser.add_argument('-H', type=str, help='In bundle mode, generate a C header describing the lookup table')
 
 def _sanitize_name(name: str) -> str:
-    return name.replace('.', '_').replace('-', '_')
+    return re.sub(r'[^A-Za-z0-9_]', '_', name)
+
+def _escape_str(s: str) -> str:
+    return s.replace('\\', '\\\\').replace('"', '\\"')
+
+def _align_up(v: int, align: int) -> int:
+    return (v + align - 1) // align * align
 
 def bin2as(varbase: str, input: str, output: str) -> bool:
     if not os.path.exists(input):
@@ -41,14 +56,208 @@ def bin2as(varbase: str, input: str, output: str) -> bool:
     return True
 
 
+def bin2as_bundle(varbase: str, inputs: list[tuple[str, str, int]], output: str, header: str | None = None) -> bool:
+    """
+    Embeds multiple files into a single assembly file, along with an index table sorted by name.
+
+    The blobs are laid out back to back in a .rodata.{varbase} section starting at the {varbase} symbol.
+    Each blob is aligned to its requested alignment, i.e. 4096 to make it page aligned. The section itself is
+    aligned to the largest alignment requested. {varbase}_index is an array of {varbase}_COUNT entries, each
+    holding three 32-bit words: the offset of the blob's name in {varbase}_names, the offset of the blob
+    from {varbase} and its size in bytes. Entries are sorted by name (strcmp order), so they can be binary searched.
+    Each blob also gets its own {varbase}_{name} and {varbase}_{name}_SIZE symbols.
+
+    Parameters
+    ----------
+    varbase : str
+        Name of the bundle symbol
+    inputs : list[tuple[str, str, int]]
+        List of (name, file, alignment) tuples
+    output : str
+        Output assembly file
+    header : str | None
+        When set, write a C header declaring the table and a lookup function
+
+    Returns
+    -------
+    bool
+        False if any of the inputs do not exist
+    """
+    for name, file, align in inputs:
+        if not os.path.exists(file):
+            return False
+        if align < 1 or align & (align - 1):
+            raise ValueError(f'Alignment of {name} must be a power of two, got {align}')
+
+    blobs = sorted(inputs, key=lambda x: x[0].encode())
+    names = [x[0] for x in blobs]
+    if len(set(names)) != len(names):
+        raise ValueError(f'Duplicate blob names in bundle {varbase}')
+
+    # Names are sanitized into symbols, i.e. a.b and a_b both become {varbase}_a_b
+    syms = {f'{varbase}_COUNT': None, f'{varbase}_index': None, f'{varbase}_names': None}
+    for name in names:
+        sym = f'{varbase}_{_sanitize_name(name)}'
+        for x in (sym, f'{sym}_SIZE'):
+            if x in syms:
+                other = f'blob {syms[x]}' if syms[x] is not None else 'the bundle tables'
+                raise ValueError(f'Symbol {x} of blob {name} collides with {other} in bundle {varbase}')
+            syms[x] = name
+
+    # Precompute the layout. Padding is emitted explicitly, and the bundle start is aligned to the
+    # largest alignment, so every blob ends up aligned in memory as well.
+    max_align = max([x[2] for x in blobs] + [8])
+    offset = 0
+    name_offset = 0
+    layout = []
+    for name, file, align in blobs:
+        pad = _align_up(offset, align) - offset
+        offset += pad
+        sz = os.path.getsize(file)
+        layout.append((name, file, pad, offset, sz, name_offset))
+        offset += sz
+        name_offset += len(name.encode()) + 1
+
+    with open(output, 'w') as fp:
+        fp.write('/** Generated file! Do not edit! **/\n\n')
+        fp.write('.section .rodata\n')
+        fp.write('.balign 4\n\n')
+        fp.write(f'.global {varbase}_COUNT\n')
+        fp.write(f'{varbase}_COUNT: .long {len(layout)}\n\n')
+        fp.write(f'.global {varbase}_index\n')
+        fp.write(f'{varbase}_index:\n')
+        for name, file, pad, off, sz, noff in layout:
+            fp.write(f'    .long {noff}, {off}, {sz} /* {name} */\n')
+        fp.write(f'\n.global {varbase}_names\n')
+        fp.write(f'{varbase}_names:\n')
+        for name, *_ in layout:
+            fp.write(f'    .asciz "{_escape_str(name)}"\n')
+        fp.write('\n')
+        for name, file, pad, off, sz, noff in layout:
+            sym = f'{varbase}_{_sanitize_name(name)}'
+            fp.write(f'.global {sym}_SIZE\n')
+            fp.write(f'{sym}_SIZE: .long {sz}\n')
+
+        fp.write(f'\n.section .rodata.{varbase},"a"\n')
+        fp.write(f'.balign {max_align}\n')
+        fp.write(f'.global {varbase}\n')
+        fp.write(f'{varbase}:\n')
+        for name, file, pad, off, sz, noff in layout:
+            sym = f'{varbase}_{_sanitize_name(name)}'
+            if pad > 0:
+                fp.write(f'.skip {pad}\n')
+            fp.write(f'.global {sym}\n')
+            fp.write(f'{sym}:\n')
+            # Catches inputs that changed size after this file was generated
+            fp.write(f'.if ({sym} - {varbase}) != {off}\n')
+            fp.write(f'.error "bin2as: unexpected offset for {name}"\n')
+            fp.write('.endif\n')
+            fp.write(f'.incbin "{os.path.abspath(file)}"\n\n')
+        # The offset checks above don't cover the end of the last blob
+        fp.write(f'.if (. - {varbase}) != {offset}\n')
+        fp.write(f'.error "bin2as: unexpected size of bundle {varbase}"\n')
+        fp.write('.endif\n')
+
+    if header is not None:
+        _write_bundle_header(varbase, header)
+    return True
+
+
+def _write_bundle_header(varbase: str, header: str):
+    """
+    Writes a C header describing a bundle generated by bin2as_bundle
+    """
+    guard = _sanitize_name(os.path.basename(header)).upper()
+    with open(header, 'w') as fp:
+        fp.write(f"""/** Generated file! Do not edit! **/
+#ifndef {guard}
+#define {guard}
+
+#include <stddef.h>
+#include <stdint.h>
+#include <string.h>
+
+#ifndef BIN2AS_BLOB_T_DEFINED
+#define BIN2AS_BLOB_T_DEFINED
+typedef struct bin2as_blob {{
+    uint32_t name;   /* Offset of the name in the names table */
+    uint32_t offset; /* Offset of the data from the start of the bundle */
+    uint32_t size;   /* Size of the data in bytes */
+}} bin2as_blob_t;
+#endif
+
+extern const unsigned char {varbase}[];
+extern const uint32_t {varbase}_COUNT;
+extern const bin2as_blob_t {varbase}_index[];
+extern const char {varbase}_names[];
+
+/**
+ * Looks up a blob by name. Returns NULL if it's not in the bundle.
+ * If size is not NULL, it receives the size of the blob.
+ */
+static inline const void* {varbase}_find(const char* name, size_t* size)
+{{
+    uint32_t lo = 0, hi = {varbase}_COUNT;
+    while (lo < hi) {{
+        uint32_t mid = lo + (hi - lo) / 2;
+        int c = strcmp(name, {varbase}_names + {varbase}_index[mid].name);
+        if (c == 0) {{
+            if (size)
+                *size = {varbase}_index[mid].size;
+            return {varbase} + {varbase}_index[mid].offset;
+        }}
+        if (c < 0)
+            hi = mid;
+        else
+            lo = mid + 1;
+    }}
+    return NULL;
+}}
+
+#endif /* {guard} */
+""")
+
+
+def _parse_bundle_input(spec: str, default_align: int) -> tuple[str, str, int]:
+    """
+    Parses a bundle input in the form [NAME=]FILE[@ALIGN]
+    """
+    align = default_align
+    m = re.match(r'^(.*)@([0-9]+|0x[0-9a-fA-F]+)$', spec)
+    if m is not None:
+        spec, align = m.group(1), _parse_align(m.group(2))
+    name, sep, file = spec.partition('=')
+    if not sep:
+        file = name
+        name = os.path.basename(file)
+    return (name, file, align)
+
+
 def main():
     args = parser.parse_args()
 
-    VARBASE = _sanitize_name(os.path.basename(args.i))
+    if args.b:
+        if args.v is None:
+            print('-v must be provided in bundle mode')
+            exit(1)
+        try:
+            inputs = [_parse_bundle_input(x, args.a) for x in args.i]
+            if not bin2as_bundle(args.v, inputs, args.o, args.H):
+                exit(1)
+        except ValueError as e:
+            print(e)
+            exit(1)
+        return
+
+    if len(args.i) > 1:
+        print('Multiple inputs require bundle mode (-b)')
+        exit(1)
+
+    VARBASE = _sanitize_name(os.path.basename(args.i[0]))
     if args.v is not None:
         VARBASE = args.v
     
-    if not bin2as(VARBASE, args.i, args.o):
+    if not bin2as(VARBASE, args.i[0], args.o):
         exit(1)
 
 if __name__ == '__main__':
@@ -15,6 +15,8 @@
 # Defines the following functions:
 #  rtems_add_executable
 #  rtems_add_object
+#  rtems_add_bundle
+#  rtems_enable_pch
 #  rtems_check_include
 #  rtems_check_lib
 
@@ -40,6 +42,7 @@ endfunction()
 # Parameters:
 #  - CEXPSH            : Enable cexp symbol table generation
 #  - RTEMS_SYMS        : Enable rtems-syms symbol table generation
+#  - NO_PCH            : Don't use the shared precompiled header, even if RTEMS_PCH is set
 #  - TARGET <target>   : Name of the target
 #  - SOURCES <srcs...> : List of sources
 function(rtems_add_executable)
@@ -72,7 +75,7 @@ function(rtems_add_executable)
     # Parse the args
     cmake_parse_arguments(
         arg
-        "CEXPSH;RTEMS_SYMS"
+        "CEXPSH;RTEMS_SYMS;NO_PCH"
         "TARGET"
         "SOURCES"
         ${ARGN}
@@ -91,15 +94,31 @@ function(rtems_add_executable)
         DEPENDS "${CMAKE_CURRENT_FUNCTION_LIST_DIR}/../sym/base-symbols.toml"
     )
 
+    # With LTO enabled (see --profile=speed), the forced refs are built without it so the symbols
+    # they reference are seen as used by a regular object, and don't get internalized or dropped
+    set_source_files_properties(
+        "${CMAKE_BINARY_DIR}/${TARGET}-extra-syms.c" PROPERTIES SKIP_PRECOMPILE_HEADERS ON
+    )
+    if ("${RTEMS_PROFILE}" STREQUAL "speed" OR "${CMAKE_C_FLAGS}" MATCHES "-flto")
+        set_source_files_properties(
+            "${CMAKE_BINARY_DIR}/${TARGET}-extra-syms.c" PROPERTIES COMPILE_OPTIONS "-fno-lto"
+        )
+    endif()
+
     # Generate base executable that will be used to feed rtems-syms
     add_executable(
         ${TARGET} "${CMAKE_BINARY_DIR}/${TARGET}-extra-syms.c" ${arg_SOURCES}
     )
 
-    # Set linker flags
+    if (RTEMS_PCH AND NOT arg_NO_PCH)
+        rtems_enable_pch(TARGET ${TARGET})
+    endif()
+
+    # Set linker flags. The ref function is only referenced from here, so it must be a GC root
+    # for -Wl,--gc-sections to leave it (and everything it references) in the image.
     separate_arguments(RTEMS_EXE_LDFLAGS)
     target_link_options(
-        ${TARGET} PRIVATE ${RTEMS_EXE_LDFLAGS}
+        ${TARGET} PRIVATE ${RTEMS_EXE_LDFLAGS} "-Wl,--undefined=__symbolRefDummy"
     )
 
     # Legacy CEXP path. Uses rtems-xsyms to generate a symbol list for use with Cexpsh.
@@ -164,13 +183,20 @@ function(rtems_add_executable)
     # Set the same linker flags
     separate_arguments(RTEMS_EXE_LDFLAGS)
     target_link_options(
-        ${TARGET}-exe PRIVATE ${RTEMS_EXE_LDFLAGS}
+        ${TARGET}-exe PRIVATE ${RTEMS_EXE_LDFLAGS} "-Wl,--undefined=__symbolRefDummy"
     )
 
+    # Report the image size, so the effect of the build profile is visible in every build
+    set(size_cmd)
+    if (CMAKE_SIZE)
+        set(size_cmd COMMAND "${CMAKE_SIZE}" "${TARGET}.exe")
+    endif()
+
     # Generate a flat binary file that can be directly booted
     add_custom_command(
         OUTPUT "${CMAKE_BINARY_DIR}/${TARGET}.boot"
         COMMAND "${CMAKE_OBJCOPY}" -O binary "${TARGET}.exe" "${TARGET}.boot"
+        ${size_cmd}
         DEPENDS "${TARGET}-exe"
         COMMENT "Generating bootable image ${TARGET}.boot"
     )
@@ -208,39 +234,47 @@ function(rtems_add_executable)
 endfunction()
 
 # Adds a target to generate a u-boot bootable image (not flat bin)
+# The image is generated by mkimage.py, so u-boot-tools don't need to be installed.
 # Parameters:
 #  TARGET      - Name of the target
+#  LOADADDR    - Load address of the image
+# Optional args:
+#  ENTRY       - Entry point, defaults to LOADADDR
+#  NAME        - Image name, defaults to RTEMS
+#  COMPRESSION - none, gzip (default) or lzma
 function(rtems_add_uboot_image TARGET LOADADDR)
-    #$ mkimage -A arm64 -O rtems -T kernel -a 0x10000 -e 0x10000 -n RTEMS -d ticker.bin.gz rtems.img
-    
-    if ("${RTEMS_ARCH}" STREQUAL "aarch64")
-        set(ARCH "arm64")
-    else()
-        set(ARCH "${RTEMS_ARCH}")
+    cmake_parse_arguments(
+        arg
+        ""
+        "ENTRY;NAME;COMPRESSION"
+        ""
+        ${ARGN}
+    )
+
+    if (NOT arg_ENTRY)
+        set(arg_ENTRY "${LOADADDR}")
+    endif()
+    if (NOT arg_NAME)
+        set(arg_NAME "RTEMS")
+    endif()
+    if (NOT arg_COMPRESSION)
+        set(arg_COMPRESSION "gzip")
     endif()
 
-    # Compress the flat binary with gzip
-    add_custom_command(
-        OUTPUT "${CMAKE_BINARY_DIR}/${TARGET}.boot.gz"
-        COMMAND gzip -9 "${CMAKE_BINARY_DIR}/${TARGET}.boot" -S .gz -k -f
-        DEPENDS "${CMAKE_BINARY_DIR}/${TARGET}.boot"
-        COMMENT "Compressing bootfile with gzip"
-    )
-    
     # Generate the actual image
     add_custom_command(
         OUTPUT "${CMAKE_BINARY_DIR}/${TARGET}.img"
-        # "${RTEMS_TOOLS_TOP}/mkimage.py"
-        COMMAND mkimage
-            -A ${ARCH}
+        COMMAND "${CMAKE_CURRENT_FUNCTION_LIST_DIR}/../mkimage.py"
+            -A "${RTEMS_ARCH}"
             -O rtems
             -T kernel
-            -a ${LOADADDR}
-            -e ${LOADADDR}
-            -n RTEMS # TODO: Make it namable!
-            -d "${CMAKE_BINARY_DIR}/${TARGET}.boot.gz"
+            -C "${arg_COMPRESSION}"
+            -a "${LOADADDR}"
+            -e "${arg_ENTRY}"
+            -n "${arg_NAME}"
+            -d "${CMAKE_BINARY_DIR}/${TARGET}.boot"
             "${CMAKE_BINARY_DIR}/${TARGET}.img"
-        DEPENDS "${CMAKE_BINARY_DIR}/${TARGET}.boot.gz"
+        DEPENDS "${CMAKE_BINARY_DIR}/${TARGET}.boot" "${CMAKE_CURRENT_FUNCTION_LIST_DIR}/../mkimage.py"
         COMMENT "Generating U-Boot image for ${TARGET}"
     )
     
@@ -254,6 +288,8 @@ endfunction()
 # Parameters:
 #  TARGET       - Name of the target to add
 #  BASE_TARGET  - Name of the base executable
+# Uses the shared precompiled header if RTEMS_PCH is set. Use rtems_enable_pch(TARGET ... EXCLUDE ...)
+# to opt individual sources out.
 function(rtems_add_object TARGET BASE_TARGET)
 
     add_library(
@@ -261,6 +297,10 @@ function(rtems_add_object TARGET BASE_TARGET)
         ${ARGN}
     )
 
+    if (RTEMS_PCH)
+        rtems_enable_pch(TARGET ${TARGET})
+    endif()
+
     # Add a custom command to generate the generic elf object.
     # Cannot use add_library/add_executable because it appends either -shared, or pulls in other undesirable link flags
     add_custom_command(
@@ -423,9 +463,6 @@ endfunction()
 function(rtems_add_rootfs TARGET DIR TYPE)
     enable_language(ASM)
 
-    # Generate list of files we'll depend on
-    file(GLOB_RECURSE ROOTFS_FILES "${DIR}/**")
-
     set(ROOTFS_ARGS "")
     if ("${TYPE}" STREQUAL "tar" OR "${TYPE}" STREQUAL "TAR")
         set(ROOTFS_ARGS "-t")
@@ -435,9 +472,14 @@ function(rtems_add_rootfs TARGET DIR TYPE)
         OUTPUT "${CMAKE_BINARY_DIR}/${TARGET}-rootfs.S"
         COMMAND "${CMAKE_CURRENT_FUNCTION_LIST_DIR}/../mkrootfs.py" "${ROOTFS_ARGS}"
             -o "${CMAKE_BINARY_DIR}/${TARGET}-rootfs.S" -i "${DIR}"
+            -d "${CMAKE_BINARY_DIR}/${TARGET}-rootfs.d"
             -m "BSP_LIBS=${RTEMS_TOP}/target/rtems/${RTEMS_ARCH}-rtems${RTEMS_TOOL_VERSION}/${RTEMS_BSP}/lib"
             -m "TOOLCHAIN_LIBS=${RTEMS_TOP}/host/linux-x86_64/${RTEMS_ARCH}-rtems${RTEMS_TOOL_VERSION}/lib"
-        DEPENDS ${ROOTFS_FILES}
+        # mkrootfs writes the list of embedded files (after macro substitution) to the depfile
+        DEPFILE "${CMAKE_BINARY_DIR}/${TARGET}-rootfs.d"
+        DEPENDS "${DIR}/rootfs.txt"
+                "${CMAKE_CURRENT_FUNCTION_LIST_DIR}/../mkrootfs.py"
+                "${CMAKE_CURRENT_FUNCTION_LIST_DIR}/../bin2as.py"
     )
     
     # Add rootfs sources to target
@@ -472,6 +514,146 @@ function(rtems_add_dts TARGET FILE)
     )
 endfunction()
 
+# Embeds a set of binary files into the target with a single bin2as call.
+# Generates ${NAME}.h in ${CMAKE_BINARY_DIR}, which declares a sorted index table and
+# ${NAME}_find() to look up a blob by its file name at runtime.
+# Summary of args:
+#  - TARGET: String; Name of the target
+#  - NAME: String; Symbol name of the bundle
+#  - ALIGN: Number; Alignment of each blob in bytes, i.e. 4096 for page aligned blobs. Defaults to 8
+#  - FILES: List; Files to embed
+function(rtems_add_bundle)
+    cmake_parse_arguments(
+        arg
+        ""
+        "TARGET;NAME;ALIGN"
+        "FILES"
+        ${ARGN}
+    )
+
+    if (NOT arg_ALIGN)
+        set(arg_ALIGN 8)
+    endif()
+
+    set(BUNDLE_INPUTS "")
+    set(BUNDLE_FILES "")
+    foreach(FILE ${arg_FILES})
+        get_filename_component(ABS_FILE "${FILE}" ABSOLUTE)
+        list(APPEND BUNDLE_INPUTS -i "${ABS_FILE}")
+        list(APPEND BUNDLE_FILES "${ABS_FILE}")
+    endforeach()
+
+    add_custom_command(
+        OUTPUT "${CMAKE_BINARY_DIR}/${arg_NAME}.S" "${CMAKE_BINARY_DIR}/${arg_NAME}.h"
+        COMMAND "${CMAKE_CURRENT_FUNCTION_LIST_DIR}/../bin2as.py"
+            -b -v "${arg_NAME}" -a "${arg_ALIGN}"
+            -o "${CMAKE_BINARY_DIR}/${arg_NAME}.S"
+            -H "${CMAKE_BINARY_DIR}/${arg_NAME}.h"
+            ${BUNDLE_INPUTS}
+        DEPENDS ${BUNDLE_FILES} "${CMAKE_CURRENT_FUNCTION_LIST_DIR}/../bin2as.py"
+        COMMENT "Generating bundle ${arg_NAME}"
+        COMMAND_EXPAND_LISTS
+    )
+
+    target_sources(
+        ${arg_TARGET} PRIVATE "${CMAKE_BINARY_DIR}/${arg_NAME}.S"
+    )
+    target_include_directories(
+        ${arg_TARGET} PRIVATE "${CMAKE_BINARY_DIR}"
+    )
+endfunction()
+
+# Uses a precompiled header of the RTEMS system headers for a target.
+# By default all targets share one PCH per build tree (and so per BSP), built from <rtems.h>, <bsp.h>
+# and, if rtems_cmake_init found the BSD stack, the common libbsd headers. Passing HEADERS gives the
+# target its own PCH instead, as do definitions or flags that differ from the shared PCH's.
+# Set RTEMS_PCH to ON to do this for every target made by rtems_add_executable/rtems_add_object.
+# Summary of args:
+#  - TARGET: String; Name of the target
+#  - HEADERS: List; Headers to precompile instead of the defaults
+#  - EXCLUDE: List; Sources that must not use the PCH, i.e. ones that need different macros before <rtems.h>
+function(rtems_enable_pch)
+    cmake_parse_arguments(
+        arg
+        ""
+        "TARGET"
+        "HEADERS;EXCLUDE"
+        ${ARGN}
+    )
+
+    if (arg_EXCLUDE)
+        set_source_files_properties(
+            ${arg_EXCLUDE} TARGET_DIRECTORY ${arg_TARGET} PROPERTIES SKIP_PRECOMPILE_HEADERS ON
+        )
+    endif()
+
+    if (arg_HEADERS)
+        target_precompile_headers(${arg_TARGET} PRIVATE ${arg_HEADERS})
+        return()
+    endif()
+
+    # Shared PCH, compiled once by a dummy object library for each enabled language
+    if (NOT TARGET rtems-pch)
+        get_property(langs GLOBAL PROPERTY ENABLED_LANGUAGES)
+        set(srcs)
+        foreach (lang C CXX)
+            if ("${lang}" IN_LIST langs)
+                if ("${lang}" STREQUAL "C")
+                    set(ext "c")
+                else()
+                    set(ext "cpp")
+                endif()
+                file(CONFIGURE OUTPUT "${CMAKE_BINARY_DIR}/rtems-pch.${ext}" CONTENT "/* Builds the shared RTEMS precompiled header */\n")
+                list(APPEND srcs "${CMAKE_BINARY_DIR}/rtems-pch.${ext}")
+            endif()
+        endforeach()
+
+        set(headers "<rtems.h>" "<bsp.h>")
+        if (RTEMS_BSD_STACK)
+            list(APPEND headers "<rtems/bsd/bsd.h>" "<sys/socket.h>" "<netinet/in.h>")
+        endif()
+
+        add_library(rtems-pch OBJECT ${srcs})
+        target_precompile_headers(rtems-pch PRIVATE ${headers})
+        set_property(GLOBAL PROPERTY RTEMS_PCH_HEADERS ${headers})
+    endif()
+
+    # REUSE_FROM only works when the target is compiled like rtems-pch. Flags may still be added after
+    # this call, so that's checked once the top-level CMakeLists.txt has been processed. Arguments of
+    # deferred calls are expanded when they run, hence the EVAL
+    cmake_language(EVAL CODE "cmake_language(DEFER DIRECTORY [[${CMAKE_SOURCE_DIR}]] CALL _rtems_reuse_pch [[${arg_TARGET}]])")
+endfunction()
+
+# Reuses the shared PCH for a target if its definitions and flags match rtems-pch, and otherwise
+# gives it its own PCH of the same headers. Usage requirements of linked targets aren't compared.
+function(_rtems_reuse_pch TARGET)
+    set(reuse ON)
+    foreach (prop COMPILE_DEFINITIONS COMPILE_OPTIONS COMPILE_FLAGS C_STANDARD C_EXTENSIONS CXX_STANDARD CXX_EXTENSIONS POSITION_INDEPENDENT_CODE)
+        get_property(a TARGET ${TARGET} PROPERTY ${prop})
+        get_property(b TARGET rtems-pch PROPERTY ${prop})
+        if (NOT "${a}" STREQUAL "${b}")
+            set(reuse OFF)
+        endif()
+    endforeach()
+
+    # Definitions added with add_definitions/add_compile_definitions stay on the directory
+    get_property(dir TARGET ${TARGET} PROPERTY SOURCE_DIR)
+    get_property(pch_dir TARGET rtems-pch PROPERTY SOURCE_DIR)
+    get_property(a DIRECTORY "${dir}" PROPERTY COMPILE_DEFINITIONS)
+    get_property(b DIRECTORY "${pch_dir}" PROPERTY COMPILE_DEFINITIONS)
+    if (NOT "${a}" STREQUAL "${b}")
+        set(reuse OFF)
+    endif()
+
+    if (reuse)
+        target_precompile_headers(${TARGET} REUSE_FROM rtems-pch)
+    else()
+        message(VERBOSE "${TARGET}: flags differ from rtems-pch, using its own precompiled header")
+        get_property(headers GLOBAL PROPERTY RTEMS_PCH_HEADERS)
+        target_precompile_headers(${TARGET} PRIVATE ${headers})
+    endif()
+endfunction()
+
 # Check for a library. Similar to check_library_exists, but uses a more direct method of searching for symbols.
 # Performing an actual binary compilation can be tricky with RTEMS, and often fails due to the interdependence of
 # libraries. Using nm to directly check for defined symbols works much more reliably
@@ -13,10 +13,19 @@
 # contained in the LICENSE.txt file.
 # ----------------------------------------------------------------------------
 import os
+import re
 import sys
 import argparse
 import subprocess
 import string
+import functools
+import contextlib
+import time
+import threading
+import hashlib
+import json
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 # This is the main toolchain fragment that is substituted with values from pkgconfig
 TOOLCHAIN_FRAGMENT = \
@@ -57,6 +66,7 @@ set(CMAKE_ASM_COMPILER "$${RTEMS_TOOLS_TOP}/$${RTEMS_TOOL_PREFIX}gcc")
 set(CMAKE_LINKER "$${RTEMS_TOOLS_TOP}/$${RTEMS_TOOL_PREFIX}ld")
 set(CMAKE_AR "$${RTEMS_TOOLS_TOP}/$${RTEMS_TOOL_PREFIX}ar")
 set(CMAKE_OBJCOPY "$${RTEMS_TOOLS_TOP}/$${RTEMS_TOOL_PREFIX}objcopy")
+set(CMAKE_SIZE "$${RTEMS_TOOLS_TOP}/$${RTEMS_TOOL_PREFIX}size")
 set(CMAKE_RTEMS_LD "$${RTEMS_TOOLS_TOP}/rtems-ld")
 set(CMAKE_RTEMS_XSYMS "$${RTEMS_TOOLS_TOP}/rtems-xsyms")
 set(CMAKE_RTEMS_SYMS "$${RTEMS_TOOLS_TOP}/rtems-syms")
@@ -70,21 +80,186 @@ set(CMAKE_FIND_ROOT_PATH_MODE_PACKAGE ONLY)
 # When testing $${CMAKE_C[XX]_COMPILER} functionality, don't try to link a test application
 set(CMAKE_TRY_COMPILE_TARGET_TYPE STATIC_LIBRARY)
 
-set(CMAKE_C_FLAGS "${CFLAGS}")
-set(CMAKE_CXX_FLAGS "${CFLAGS}")
-set(CMAKE_EXE_LINKER_FLAGS "${LIBS}")
+# Build profile, configure with --profile=(none|size|speed|debug)
+set(RTEMS_PROFILE "${PROFILE}")
+set(RTEMS_PROFILE_CFLAGS "${PROFILE_CFLAGS}")
+set(RTEMS_PROFILE_LDFLAGS "${PROFILE_LDFLAGS}")
+
+set(CMAKE_C_FLAGS "${CFLAGS} $${RTEMS_PROFILE_CFLAGS}")
+set(CMAKE_CXX_FLAGS "${CFLAGS} $${RTEMS_PROFILE_CFLAGS}")
+set(CMAKE_EXE_LINKER_FLAGS "${LIBS} $${RTEMS_PROFILE_LDFLAGS}")
 set(CMAKE_SHARED_LINKER_FLAGS "-Wl,--undefined -Wl,-r -nostdlib")
 set(CMAKE_MODULE_LINKER_FLAGS "-Wl,--undefined -Wl,-r -nostdlib")
+${LAUNCHER_FRAGMENT}"""
+
+# Appended to the toolchain when a compiler launcher (ccache/sccache) is in use
+LAUNCHER_FRAGMENT = \
+"""
+# Compiler launcher, configure with --compiler-launcher=none to disable
+set(CMAKE_C_COMPILER_LAUNCHER "${LAUNCHER}")
+set(CMAKE_CXX_COMPILER_LAUNCHER "${LAUNCHER}")
 """
 
+# Build profiles. The compile flags come after the BSP's own CFLAGS, so the -O level here wins.
+# speed uses fat LTO objects so that archives and the rtems_add_object partial links (which do
+# not run LTO) still get regular code.
+PROFILES = {
+    'none': {
+        'cflags': '',
+        'ldflags': '',
+    },
+    'size': {
+        'cflags': '-Os -ffunction-sections -fdata-sections',
+        'ldflags': '-Wl,--gc-sections',
+    },
+    'speed': {
+        'cflags': '-O2 -ffunction-sections -fdata-sections -flto=auto -ffat-lto-objects',
+        'ldflags': '-Wl,--gc-sections',
+    },
+    'debug': {
+        'cflags': '-Og -g3 -fno-omit-frame-pointer',
+        'ldflags': '',
+    },
+}
+
+# Supported compiler launchers, in order of preference
+LAUNCHERS = ['ccache', 'sccache']
+
+# Variables pulled out of each BSP's .pc file
+PC_VARIABLES = [
+    'RTEMS_MAJOR',
+    'RTEMS_MINOR',
+    'RTEMS_REVISION',
+    'RTEMS_BSP_FAMILY',
+    'RTEMS_BSP_BASE',
+    'RTEMS_BSP',
+    'RTEMS_ARCH',
+]
+
+class PcFile:
+    """
+    Minimal reader for pkg-config .pc files. Handles variable definitions and ${var}
+    references, keyword fields (Cflags, Libs, Requires, etc.) and Requires resolution
+    against a list of search directories.
+    """
+    _REF = re.compile(r'\$\$|\$\{([^}]+)\}')
+    _LINE = re.compile(r'^([A-Za-z0-9_.]+)\s*([:=])\s*(.*)$')
+    _REQ = re.compile(r'([<>!]?=|[<>])|([^\s,<>=!]+)')
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path).removesuffix('.pc')
+        self.vars = {'pcfiledir': os.path.dirname(os.path.abspath(path))}
+        self.fields = {}
+        with open(path, 'r') as fp:
+            for l in fp.readlines():
+                l = l.split('#', 1)[0].strip()
+                m = self._LINE.match(l)
+                if m is None:
+                    continue
+                k, op, v = m.groups()
+                # Like pkg-config, references are expanded using the variables defined so far
+                if op == '=':
+                    self.vars[k] = self._expand(v)
+                else:
+                    self.fields[k] = self._expand(v)
+
+    def _expand(self, v: str) -> str:
+        def sub(m: re.Match) -> str:
+            if m.group(0) == '$$':
+                return '$'
+            if m.group(1) not in self.vars:
+                raise ValueError(f'{self.path}: undefined variable {m.group(1)}')
+            return self.vars[m.group(1)]
+        return self._REF.sub(sub, v)
+
+    def requires(self, private: bool = False) -> list[str]:
+        """Returns the names of the required packages, without version constraints"""
+        reqs = []
+        skip = False
+        for op, name in self._REQ.findall(self.fields.get('Requires.private' if private else 'Requires', '')):
+            if op:
+                skip = True # Next token is the version
+            elif skip:
+                skip = False
+            else:
+                reqs.append(name)
+        return reqs
+
+    def flags(self, field: str) -> list[str]:
+        """Returns the whitespace separated tokens of a field"""
+        return self.fields.get(field, '').split()
+
+
+class PkgConfig:
+    """Native replacement for the pkg-config queries cmake_configure needs"""
+    def __init__(self, search_dirs: list[str]):
+        self.search_dirs = search_dirs
+        self._files = {}
+
+    def load(self, name: str) -> PcFile:
+        """Loads and caches the .pc file for a package"""
+        if name not in self._files:
+            for d in self.search_dirs:
+                if os.path.exists(f'{d}/{name}.pc'):
+                    self._files[name] = PcFile(f'{d}/{name}.pc')
+                    break
+            else:
+                raise FileNotFoundError(f'Package {name} was not found in {":".join(self.search_dirs)}')
+        return self._files[name]
+
+    def _collect(self, name: str, field: str, private: bool, seen: set) -> list[str]:
+        if name in seen:
+            return []
+        seen.add(name)
+        pc = self.load(name)
+        r = pc.flags(field)
+        deps = pc.requires() + (pc.requires(True) if private else [])
+        for d in deps:
+            r += self._collect(d, field, private, seen)
+        return r
+
+    # Flags whose argument is the next token, kept together with it as one unit
+    ARG_FLAGS = ['-I', '-L', '-l', '-D', '-isystem', '-idirafter', '-iquote', '-include', '-imacros', '-Xlinker', '-framework', '-specs']
+    # Flags that can be dropped when repeated, anything else is kept as is
+    DEDUP_FLAGS = ('-I', '-L', '-l', '-D')
+
+    @classmethod
+    def _dedup(cls, flags: list[str]) -> str:
+        """Like pkg-config, drops duplicate -I/-L/-l/-D flags keeping the last occurrence"""
+        units = []
+        for f in flags:
+            if len(units) > 0 and units[-1] in cls.ARG_FLAGS:
+                units[-1] += f' {f}'
+            else:
+                units.append(f)
+        last = {u: i for i, u in enumerate(units)}
+        return ' '.join([u for i, u in enumerate(units) if not u.startswith(cls.DEDUP_FLAGS) or last[u] == i])
+
+    def cflags(self, name: str) -> str:
+        """Equivalent of pkg-config --cflags. Includes Cflags from Requires and Requires.private"""
+        return self._dedup(self._collect(name, 'Cflags', True, set()))
+
+    def libs(self, name: str) -> str:
+        """Equivalent of pkg-config --libs. Includes Libs from Requires"""
+        return self._dedup(self._collect(name, 'Libs', False, set()))
+
+    def variable(self, name: str, var: str) -> str:
+        """Equivalent of pkg-config --variable"""
+        return self.load(name).vars.get(var, '')
+
+
 class Target:
-    """Represents a single RTEMS target, as defined by pkgconfig"""
-    def __init__(self, pkgconfig_dir: str, arch: str, rtems: str, bsp: str):
+    """
+    Represents a single RTEMS target, as defined by pkgconfig.
+    The .pc file is only read when cflags, libs or vars are first accessed.
+    """
+    def __init__(self, pkgconfig_dir: str, arch: str, rtems: str, bsp: str, pkgconfig: PkgConfig | None = None):
         self.arch = arch
         self.rtems = rtems
         self.bsp = bsp
         self.pkgconfig_dir = pkgconfig_dir
-        self._pkgconfig_parse()
+        self.pkgconfig = pkgconfig if pkgconfig is not None else PkgConfig([pkgconfig_dir])
     
     def _run_pkgconfig(self, args: list[str]) -> str | None:
         """Runs pkgconfig"""
@@ -99,19 +274,38 @@ class Target:
             return r.stdout.decode().strip()
         return None
     
-    def _pkgconfig_parse(self):
-        """Uses pkgconfig to parse out the cflags, ldflags, etc."""
-        self.cflags = self._run_pkgconfig(['--cflags', self.arch_bsp()])
-        self.libs = self._run_pkgconfig(['--libs', self.arch_bsp()])
-        self.vars = {x: self._run_pkgconfig([f'--variable={x}', self.arch_bsp()]) for x in [
-            'RTEMS_MAJOR',
-            'RTEMS_MINOR',
-            'RTEMS_REVISION',
-            'RTEMS_BSP_FAMILY',
-            'RTEMS_BSP_BASE',
-            'RTEMS_BSP',
-            'RTEMS_ARCH',
-        ]}
+    @functools.cached_property
+    def _pkgconfig(self) -> tuple[str | None, str | None, dict]:
+        """
+        Parses out the cflags, ldflags, etc. Uses the native .pc reader, falling back to
+        running pkgconfig if the file (or one of the packages it requires) can't be handled.
+        """
+        name = self.arch_bsp()
+        try:
+            return (
+                self.pkgconfig.cflags(name),
+                self.pkgconfig.libs(name),
+                {x: self.pkgconfig.variable(name, x) for x in PC_VARIABLES}
+            )
+        except (OSError, ValueError) as e:
+            print(f'Native pkgconfig parsing failed for {name} ({e}), falling back to pkg-config')
+        return (
+            self._run_pkgconfig(['--cflags', name]),
+            self._run_pkgconfig(['--libs', name]),
+            {x: self._run_pkgconfig([f'--variable={x}', name]) for x in PC_VARIABLES}
+        )
+
+    @property
+    def cflags(self) -> str | None:
+        return self._pkgconfig[0]
+
+    @property
+    def libs(self) -> str | None:
+        return self._pkgconfig[1]
+
+    @property
+    def vars(self) -> dict:
+        return self._pkgconfig[2]
 
     def arch_bsp(self):
         """Returns the arch bsp string, i.e. aarch64-rtems7-k26"""
@@ -136,7 +330,7 @@ class Target:
             return True
         return False
 
-    def generate_toolchain(self, rtems_top: str, rtems_tools_top: str) -> str:
+    def generate_toolchain(self, rtems_top: str, rtems_tools_top: str, launcher: str | None = None, profile: str = 'none') -> str:
         """
         Generates a CMake toolchain file for use with this BSP
         
@@ -146,6 +340,10 @@ class Target:
             Path to the RTEMS install dir
         rtems_tools_top: str
             Path to the RTEMS tools install dir
+        launcher: str | None
+            Path to the compiler launcher (ccache or sccache), if any
+        profile: str
+            Name of the build profile, one of PROFILES
         """
         vars = self.vars.copy()
         vars.update({
@@ -153,7 +351,15 @@ class Target:
             'RTEMS_TOOLS_TOP': rtems_tools_top,
             'CFLAGS': self.cflags,
             'LIBS': self.libs,
+            'LAUNCHER_FRAGMENT': '',
+            'PROFILE': profile,
+            'PROFILE_CFLAGS': PROFILES[profile]['cflags'],
+            'PROFILE_LDFLAGS': PROFILES[profile]['ldflags'],
         })
+        if launcher is not None:
+            vars['LAUNCHER_FRAGMENT'] = string.Template(LAUNCHER_FRAGMENT).substitute(
+                {'LAUNCHER': ';'.join(_launcher_command(launcher))}
+            )
         return string.Template(
             TOOLCHAIN_FRAGMENT
         ).substitute(
@@ -164,6 +370,8 @@ def _find_pc_files(rtems_top: str) -> list[Target]:
     """Finds a list of targets from the specific pkgconfig directory"""
     targets = []
     pkgdir = f'{rtems_top}/lib/pkgconfig/'
+    # Shared between all targets so that common Requires are only read once
+    pkgconfig = PkgConfig([pkgdir])
     for k in os.listdir(pkgdir):
         fn = os.fsdecode(k)
         if not fn.endswith('.pc'): # Skip non-pkgconf files
@@ -175,10 +383,320 @@ def _find_pc_files(rtems_top: str) -> list[Target]:
         arch = comps[0]
         rtems = comps[1]
         bsp = '-'.join(comps[2:])
-        targets.append(Target(pkgdir, arch, rtems, bsp))
+        targets.append(Target(pkgdir, arch, rtems, bsp, pkgconfig))
     return targets
 
+class JobResult:
+    """Result of running a command for a single BSP"""
+    def __init__(self, name: str, returncode: int, duration: float, log: str | None):
+        self.name = name
+        self.returncode = returncode
+        self.duration = duration
+        self.log = log
+        self.details = ''
+        self.skipped = False
+
+    def ok(self) -> bool:
+        return self.returncode == 0
+
+
+def _run_jobs(jobs: list[tuple[str, list[str], str]], njobs: int, verb: str, env: dict | None = None,
+              pass_fds: tuple = (), acquire = None, release = None) -> list[JobResult]:
+    """
+    Runs a command per BSP, up to njobs at a time.
+
+    With njobs > 1, the output of each command goes to its log file and a single line
+    is printed as each one finishes. Otherwise the commands run one after another with
+    their output going straight to the terminal.
+
+    Parameters
+    ----------
+    jobs : list[tuple[str, list[str], str]]
+        List of (name, command, log file)
+    njobs : int
+        Maximum number of commands to run at once
+    verb : str
+        What's being done, for progress output (i.e. 'Configuring')
+    env : dict | None
+        Environment for the commands
+    pass_fds : tuple
+        File descriptors to pass to the commands
+    acquire, release :
+        Optional callables, called with the job name before and after running its command
+
+    Returns
+    -------
+    list[JobResult]
+        Results, in the same order as jobs
+    """
+    lock = threading.Lock()
+    done = [0]
+
+    def run(job: tuple[str, list[str], str]) -> JobResult:
+        name, cmd, log = job
+        if acquire is not None:
+            acquire(name)
+        try:
+            start = time.monotonic()
+            if njobs > 1:
+                os.makedirs(os.path.dirname(os.path.abspath(log)), exist_ok=True)
+                with open(log, 'w') as fp:
+                    fp.write(f'# {" ".join(cmd)}\n')
+                    fp.flush()
+                    rc = subprocess.run(cmd, stdout=fp, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                                        env=env, pass_fds=pass_fds).returncode
+            else:
+                print(f'\n--> {verb} for {name} <--\n')
+                rc = subprocess.run(cmd, env=env, pass_fds=pass_fds).returncode
+                log = None
+            r = JobResult(name, rc, time.monotonic() - start, log)
+        finally:
+            if release is not None:
+                release(name)
+        if njobs > 1:
+            with lock:
+                done[0] += 1
+                print(f'[{done[0]}/{len(jobs)}] {name}: {"ok" if r.ok() else "FAILED"} ({r.duration:.1f}s)', flush=True)
+        return r
+
+    if njobs > 1:
+        print(f'{verb} {len(jobs)} BSPs, {njobs} at a time')
+    with ThreadPoolExecutor(max(njobs, 1)) as pool:
+        return list(pool.map(run, jobs))
+
+
+def _print_summary(results: list[JobResult]):
+    """Prints a table with the status and duration of each BSP, plus the log of any failures"""
+    if len(results) == 0:
+        return
+    w = max([len(r.name) for r in results] + [3])
+    dw = max([len(r.details) for r in results])
+    print(f'\n{"BSP":<{w}}  {"Status":<8}  {"Time":>8}  ' + (f'{"Artifacts":<{dw}}  ' if dw else '') + 'Log')
+    for r in results:
+        status = 'skipped' if r.skipped else 'ok' if r.ok() else 'FAILED'
+        log = r.log if (not r.ok() and r.log) else ''
+        details = f'{r.details:<{dw}}  ' if dw else ''
+        print(f'{r.name:<{w}}  {status:<8}  {r.duration:>7.1f}s  {details}{log}')
+
+
+class Jobserver:
+    """
+    A GNU make jobserver, shared by all the builds started by cmake_build.
+
+    The pipe holds one token per job slot. Each build takes one token for itself before it
+    starts (that's the job every make runs without asking) and the makes take the rest from
+    the pipe as they go, so the total across all BSPs never exceeds the budget.
+    """
+    def __init__(self, jobs: int):
+        self.jobs = jobs
+        self.r, self.w = os.pipe()
+        os.write(self.w, b'+' * jobs)
+        self._lock = threading.Lock()
+
+    def makeflags(self) -> str:
+        # --jobserver-fds for make < 4.2, --jobserver-auth for newer versions
+        return f' -j --jobserver-fds={self.r},{self.w} --jobserver-auth={self.r},{self.w}'
+
+    def acquire(self, n: int = 1):
+        # Only one multi-token acquisition at a time, otherwise two of them could starve each other
+        with self._lock if n > 1 else contextlib.nullcontext():
+            for _ in range(n):
+                os.read(self.r, 1)
+
+    def release(self, n: int = 1):
+        os.write(self.w, b'+' * n)
+
+    def close(self):
+        os.close(self.r)
+        os.close(self.w)
+
+
+def _find_launcher(name: str) -> str | None:
+    """
+    Resolves the --compiler-launcher option to the path of a launcher, or None if there is none
+
+    Parameters
+    ----------
+    name : str
+        'auto', 'none' or the name of a launcher
+    """
+    if name == 'none':
+        return None
+    for x in (LAUNCHERS if name == 'auto' else [name]):
+        path = shutil.which(x)
+        if path is not None:
+            return path
+    if name != 'auto':
+        print(f'Compiler launcher {name} not found, building without one')
+    return None
+
+def _launcher_command(launcher: str) -> list[str]:
+    """
+    Returns the launcher command line. For ccache, paths below the source directory are rewritten
+    to relative ones (base_dir) and the working directory is left out of the hash (hash_dir), so
+    the per-BSP build directories and different checkouts of the source share cache entries.
+    """
+    if os.path.basename(launcher) == 'ccache':
+        return ['${CMAKE_COMMAND}', '-E', 'env', f'CCACHE_BASEDIR={os.path.abspath(".")}', 'CCACHE_NOHASHDIR=1', launcher]
+    return [launcher]
+
+def _launcher_stats(launcher: str) -> tuple[int, int] | None:
+    """
+    Returns the total (hits, misses) of a launcher's cache, or None if they can't be read
+    """
+    try:
+        if os.path.basename(launcher) == 'sccache':
+            r = subprocess.run([launcher, '--show-stats', '--stats-format=json'], capture_output=True, universal_newlines=True)
+            stats = json.loads(r.stdout)['stats']
+            return (sum(stats['cache_hits']['counts'].values()), sum(stats['cache_misses']['counts'].values()))
+        r = subprocess.run([launcher, '--print-stats'], capture_output=True, universal_newlines=True)
+        stats = dict([l.split('\t') for l in r.stdout.splitlines() if l.count('\t') == 1])
+        return (int(stats.get('direct_cache_hit', 0)) + int(stats.get('preprocessed_cache_hit', 0)),
+                int(stats.get('cache_miss', 0)))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write_if_changed(file: str, contents: str) -> bool:
+    """
+    Writes contents to file, unless the file already holds exactly that.
+    Returns True if the file was written.
+    """
+    try:
+        with open(file, 'r') as fp:
+            if fp.read() == contents:
+                return False
+    except OSError:
+        pass
+    with open(file, 'w') as fp:
+        fp.write(contents)
+    return True
+
+def _fingerprint(toolchain: str, cmd: list[str]) -> str:
+    """Fingerprint of everything that goes into configuring a BSP"""
+    return hashlib.sha256(json.dumps({
+        'source': os.path.abspath('.'),
+        'toolchain': toolchain,
+        'cmd': cmd,
+    }).encode()).hexdigest()
+
+
+def _format_size(sz: int) -> str:
+    for unit in ['B', 'K', 'M']:
+        if sz < 1024:
+            return f'{sz}{unit}'
+        sz //= 1024
+    return f'{sz}G'
+
+def _find_artifacts(build_dir: str) -> list[str]:
+    """Finds the .exe and .boot images in a build tree"""
+    found = []
+    for root, dirs, files in os.walk(build_dir):
+        dirs[:] = [x for x in dirs if x != 'CMakeFiles']
+        found += [f'{root}/{x}' for x in files if x.endswith('.exe') or x.endswith('.boot')]
+    return sorted(found)
+
+
+def cmake_build(argv: list[str]) -> int:
+    """
+    Builds every BSP tree configured by cmake_configure, sharing one job budget between them.
+
+    Makefile trees are run together as clients of a single GNU make jobserver. Ninja can't
+    join a make jobserver, so each Ninja tree takes the whole budget and runs with -j on its own.
+
+    Parameters
+    ----------
+    argv : list[str]
+        Arguments following the 'build' subcommand
+
+    Returns
+    -------
+    int
+        Exit code, nonzero if any build failed
+    """
+    parser = argparse.ArgumentParser(prog=f'{os.path.basename(sys.argv[0])} build',
+                                     description='Build all configured BSPs with a shared job budget')
+    parser.add_argument('--build-dir', type=str, default='build', help='Path to the build directory')
+    parser.add_argument('--rtems-arches', type=str, default=None, help='List of architectures to build')
+    parser.add_argument('--rtems-bsps', type=str, default=None, help='List of RTEMS BSPs to build')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='Total number of jobs across all BSPs')
+    parser.add_argument('-t', '--target', type=str, action='append', help='Build these targets instead of the default')
+    args = parser.parse_args(argv)
+
+    arches = args.rtems_arches.split(',') if args.rtems_arches else []
+    bsps = args.rtems_bsps.split(',') if args.rtems_bsps else []
+
+    # Each configured BSP has a {arch-bsp}.cmake toolchain next to its build tree
+    trees = []
+    for fn in sorted(os.listdir(args.build_dir)) if os.path.isdir(args.build_dir) else []:
+        if not fn.endswith('.cmake') or not os.path.exists(f'{args.build_dir}/{fn.removesuffix(".cmake")}/CMakeCache.txt'):
+            continue
+        comps = fn.removesuffix('.cmake').split('-')
+        if len(comps) < 3:
+            continue
+        t = Target('', comps[0], comps[1], '-'.join(comps[2:]))
+        if len(arches) > 0 and t.arch not in arches:
+            continue
+        if len(bsps) > 0 and not any([t.match_bsp(x) for x in bsps]):
+            continue
+        trees.append(t.arch_bsp())
+
+    if len(trees) == 0:
+        print(f'No configured BSPs found in {args.build_dir}')
+        return 1
+
+    jobserver = Jobserver(max(args.jobs, 1))
+    ninja = {x: os.path.exists(f'{args.build_dir}/{x}/build.ninja') for x in trees}
+    env = os.environ.copy()
+    env['MAKEFLAGS'] = jobserver.makeflags()
+
+    jobs = []
+    for x in trees:
+        cmd = ['cmake', '--build', f'{args.build_dir}/{x}']
+        if args.target:
+            cmd += ['--target'] + args.target
+        if ninja[x]:
+            cmd += ['-j', str(jobserver.jobs)]
+        jobs.append((x, cmd, f'{args.build_dir}/{x}.build.log'))
+
+    # Snapshot the cache stats of any launcher used by the toolchains, so hit rates can be reported
+    launchers = set()
+    for x in trees:
+        with open(f'{args.build_dir}/{x}.cmake', 'r') as fp:
+            tc = fp.read()
+        for l in LAUNCHERS:
+            m = re.search(rf'COMPILER_LAUNCHER "[^"]*?([^;"]*/{l})"', tc)
+            if m is not None:
+                launchers.add(m.group(1))
+    stats = {x: _launcher_stats(x) for x in launchers}
+
+    tokens = lambda x: jobserver.jobs if ninja[x] else 1
+    try:
+        results = _run_jobs(jobs, min(len(jobs), jobserver.jobs), 'Building', env, (jobserver.r, jobserver.w),
+                            lambda x: jobserver.acquire(tokens(x)), lambda x: jobserver.release(tokens(x)))
+    finally:
+        jobserver.close()
+
+    for r in results:
+        r.details = ' '.join([f'{os.path.basename(a)}={_format_size(os.path.getsize(a))}'
+                              for a in _find_artifacts(f'{args.build_dir}/{r.name}')])
+    _print_summary(results)
+
+    for l, before in stats.items():
+        after = _launcher_stats(l)
+        if before is None or after is None:
+            continue
+        hits, misses = after[0] - before[0], after[1] - before[1]
+        if hits + misses > 0:
+            print(f'{os.path.basename(l)}: {hits} hits, {misses} misses ({100.0 * hits / (hits + misses):.1f}% hit rate)')
+    return 0 if all([r.ok() for r in results]) else 1
+
+
 def cmake_configure(parser: argparse.ArgumentParser, cmake_args: list[str] = [], features: dict = {}):
+    # '<script> build ...' builds the BSP trees configured by a previous run
+    if len(sys.argv) > 1 and sys.argv[1] == 'build':
+        exit(cmake_build(sys.argv[2:]))
+
     parser.add_argument('--rtems-top', type=str, help='Path to the RTEMS-top area, which contains "target" and "host". Used for SLAC deployments. May be provided instead of --rtems & --rtems-tools')
     parser.add_argument('--rtems', type=str, help='Path to the RTEMS installation directory')
     parser.add_argument('--rtems-tools', type=str, help='Path to the RTEMS tools installation directory')
@@ -188,6 +706,10 @@ def cmake_configure(parser: argparse.ArgumentParser, cmake_args: list[str] = [],
     parser.add_argument('--list-bsps', action='store_true', help='Show list of available BSPs')
     parser.add_argument('--print-toolchain', action='store_true', help='Dump a CMake toolchain to stdout')
     parser.add_argument('--build-dir', type=str, default='build', help='Path to the build directory')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of BSPs to configure concurrently. When >1, output goes to {build-dir}/{arch-bsp}.configure.log')
+    parser.add_argument('--reconfigure', action='store_true', help='Run CMake even for BSPs whose toolchain and arguments are unchanged')
+    parser.add_argument('--compiler-launcher', type=str, default='auto', choices=['auto', 'none'] + LAUNCHERS, help='Compiler launcher to use. auto picks ccache or sccache if installed, none disables it')
+    parser.add_argument('--profile', type=str, default='none', choices=list(PROFILES.keys()), help='Build profile applied to all BSPs. size: -Os and section GC, speed: -O2, section GC and LTO, debug: -Og -g3')
     parser.add_argument('remaining', nargs=argparse.REMAINDER)
 
     # Add args for feature flags
@@ -264,35 +786,75 @@ def cmake_configure(parser: argparse.ArgumentParser, cmake_args: list[str] = [],
             print(t.arch_bsp())
         exit(0)
 
+    launcher = _find_launcher(args.compiler_launcher)
+    if launcher is not None:
+        print(f'compiler-launcher={launcher}')
+    print(f'profile={args.profile}')
+
     # Dump toolchains to stdout?
     if args.print_toolchain:
         for t in toolchains:
-            print(t.generate_toolchain(args.rtems, args.rtems_tools))
+            print(t.generate_toolchain(args.rtems, args.rtems_tools, launcher, args.profile))
     
     os.makedirs(args.build_dir, exist_ok=True)
     
-    # Generate toolchains into the build directory
+    # Generate toolchains into the build directory. Unchanged files are left alone, a new mtime
+    # would make CMake redo its compiler checks.
+    generated = {}
     for t in toolchains:
-        file = f'{args.build_dir}/{t.arch_bsp()}.cmake'
-        with open(file, 'w') as fp:
-            fp.write(t.generate_toolchain(args.rtems, args.rtems_tools))
+        generated[t.arch_bsp()] = t.generate_toolchain(args.rtems, args.rtems_tools, launcher, args.profile)
+        _write_if_changed(f'{args.build_dir}/{t.arch_bsp()}.cmake', generated[t.arch_bsp()])
 
     if '--' in args.remaining:
         args.remaining.remove('--')
 
     # Run the configure
+    jobs = []
+    fingerprints = {}
+    skipped = []
     for t in toolchains:
-        print(f'\n--> Configuring for {t.arch_bsp()} <--\n')
         extra_args = []
         if args.prefix:
             extra_args.append(f'-DCMAKE_INSTALL_PREFIX={args.prefix}/{t.arch_rtems()}/{t.bsp}')
 
-        subprocess.run([
+        cmd = [
             'cmake',
             '.',
             f'-B{args.build_dir}/{t.arch_bsp()}',
             f'-DCMAKE_TOOLCHAIN_FILE={args.build_dir}/{t.arch_bsp()}.cmake'
-        ] + cmake_args + extra_args + args.remaining)
+        ] + cmake_args + extra_args + args.remaining
+
+        # Skip BSPs that were configured successfully with exactly the same toolchain and arguments
+        tree = f'{args.build_dir}/{t.arch_bsp()}'
+        fingerprints[t.arch_bsp()] = _fingerprint(generated[t.arch_bsp()], cmd)
+        try:
+            with open(f'{tree}/.cmake-configure-fingerprint', 'r') as fp:
+                old = fp.read().strip()
+        except OSError:
+            old = None
+        if not args.reconfigure and old == fingerprints[t.arch_bsp()] and os.path.exists(f'{tree}/CMakeCache.txt'):
+            r = JobResult(t.arch_bsp(), 0, 0.0, None)
+            r.skipped = True
+            skipped.append(r)
+            continue
+
+        jobs.append((t.arch_bsp(), cmd, f'{tree}.configure.log'))
+
+    results = _run_jobs(jobs, args.jobs, 'Configuring') if len(jobs) > 0 else []
+
+    # Only a successful configure is recorded, failed BSPs will be retried next time
+    for r in results:
+        fp_file = f'{args.build_dir}/{r.name}/.cmake-configure-fingerprint'
+        if r.ok():
+            _write_if_changed(fp_file, fingerprints[r.name] + '\n')
+        elif os.path.exists(fp_file):
+            os.remove(fp_file)
+
+    order = {t.arch_bsp(): i for i, t in enumerate(toolchains)}
+    results = sorted(results + skipped, key=lambda x: order[x.name])
+    _print_summary(results)
+    if not all([r.ok() for r in results]):
+        exit(1)
 
 
 if __name__ == '__main__':
@@ -18,6 +18,7 @@ import subprocess
 import argparse
 import os
 import sys
+import json
 
 parser = argparse.ArgumentParser()
 parser.add_argument('-l', required=True, action='append', help='Library')
@@ -48,18 +49,99 @@ def find_lib(compiler: str, lib: str, args: list[str]):
             return ld
     return None
 
-def check_sym(lib: str, sym: str, nm: str | None = None) -> bool:
+def read_syms(lib: str, nm: str | None = None) -> set[str] | None:
     """
-    Checks if a symbol can be found in the specified library using nm
+    Returns the set of global symbols defined in the library, or None if nm fails
     """
-    r = subprocess.run([nm if nm is not None else 'nm', '-u', '-fposix', lib], capture_output=True, universal_newlines=True)
+    r = subprocess.run([nm if nm is not None else 'nm', '-g', '--defined-only', '-fposix', lib], capture_output=True, universal_newlines=True)
     if r.returncode != 0:
         print(f'NM failed with {r.stderr}')
-        return False
+        return None
+    syms = set()
     for l in r.stdout.splitlines():
-        if sym == l.split(' ')[0]:
-            return True
-    return False
+        # Archive member headers look like 'libfoo.a[bar.o]:'
+        if l == '' or l.endswith(':'):
+            continue
+        syms.add(l.split(' ')[0])
+    return syms
+
+class SymbolIndex:
+    """
+    Index of the symbols defined by each library. A library is scanned with nm once, and rescanned
+    only when its mtime or size changes. If a file is given, the index is loaded from and saved to
+    it so it persists between runs.
+    """
+    VERSION = 1
+
+    def __init__(self, file: str | None = None, nm: str | None = None):
+        self.file = file
+        self.nm = nm
+        self.libs = {}
+        self.dirty = False
+        if file is None:
+            return
+        try:
+            with open(file, 'r') as fp:
+                d = json.load(fp)
+            if d.get('version') == self.VERSION:
+                self.libs = d['libs']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def symbols(self, lib: str) -> set[str]:
+        """
+        Returns the symbols defined by lib, scanning it if it's not indexed or has changed
+        """
+        lib = os.path.abspath(lib)
+        st = os.stat(lib)
+        ent = self.libs.get(lib)
+        if ent is not None and ent['mtime'] == st.st_mtime_ns and ent['size'] == st.st_size:
+            if not isinstance(ent['syms'], set):
+                ent['syms'] = set(ent['syms'])
+            return ent['syms']
+
+        syms = read_syms(lib, self.nm)
+        if syms is None:
+            return set()
+        self.libs[lib] = {'mtime': st.st_mtime_ns, 'size': st.st_size, 'syms': syms}
+        self.dirty = True
+        return syms
+
+    def check(self, lib: str, syms: list[str]) -> dict[str, bool]:
+        """
+        Checks a batch of symbols against lib
+
+        Parameters
+        ----------
+        lib : str
+            Path to the library
+        syms : list[str]
+            Symbols to look for
+
+        Returns
+        -------
+        dict[str, bool]
+            Maps each symbol to whether lib defines it
+        """
+        found = self.symbols(lib)
+        return {x: x in found for x in syms}
+
+    def save(self):
+        """Writes the index back to its file, if it has one and anything changed"""
+        if self.file is None or not self.dirty:
+            return
+        libs = {k: {'mtime': v['mtime'], 'size': v['size'], 'syms': sorted(v['syms'])} for k, v in self.libs.items()}
+        os.makedirs(os.path.dirname(os.path.abspath(self.file)), exist_ok=True)
+        with open(f'{self.file}.tmp', 'w') as fp:
+            json.dump({'version': self.VERSION, 'libs': libs}, fp)
+        os.replace(f'{self.file}.tmp', self.file)
+        self.dirty = False
+
+def check_sym(lib: str, sym: str, nm: str | None = None) -> bool:
+    """
+    Checks if a symbol is defined in the specified library using nm
+    """
+    return SymbolIndex(nm=nm).check(lib, [sym])[sym]
 
 def make_lib_name(lib: str) -> str:
     return f'lib{lib}.a'
@@ -78,7 +160,8 @@ def main():
 
     # Check for symbols if in check-syms mode
     if args.SYM:
-        if not any([check_sym(lib, args.SYM) for lib in libs]):
+        idx = SymbolIndex()
+        if not any([idx.check(lib, [args.SYM])[args.SYM] for lib in libs]):
             print(f'{args.SYM} not found in any of: {",".join(args.l)}')
             exit(1)
     else:
@@ -1,92 +1,169 @@
 #!/usr/bin/env python3
 
 import gdb
+import os
+import json
+import struct
+import signal
+import threading
+import functools
+
+from rtems_objects import (
+    RtemsError, Target, Session, ElfSymbols, snapshot, print_tasks, print_semaphores, print_heaps, rtl_objects, elf_sections,
+    _decode_name,
+    _cpu_time_ns, THREAD_FIELDS, CPU_TIME_FIELDS, THREAD_INFORMATION,
+)
 
 class RtemsCommand(gdb.Command):
     def __init__(self):
         super().__init__('rtems', gdb.COMMAND_STATUS, gdb.COMPLETE_NONE, True)
 
-THREAD_STATES = {
-    0x00000000: "STATES_READY",
-    0x00000001: "STATES_WAITING_FOR_MUTEX",
-    0x00000002: "STATES_WAITING_FOR_SEMAPHORE",
-    0x00000004: "STATES_WAITING_FOR_EVENT",
-    0x00000008: "STATES_WAITING_FOR_SYSTEM_EVENT",
-    0x00000010: "STATES_WAITING_FOR_MESSAGE",
-    0x00000020: "STATES_WAITING_FOR_CONDITION_VARIABLE",
-    0x00000040: "STATES_WAITING_FOR_FUTEX",
-    0x00000080: "STATES_WAITING_FOR_BSD_WAKEUP",
-    0x00000100: "STATES_WAITING_FOR_TIME",
-    0x00000200: "STATES_WAITING_FOR_PERIOD",
-    0x00000400: "STATES_WAITING_FOR_SIGNAL",
-    0x00000800: "STATES_WAITING_FOR_BARRIER",
-    0x00001000: "STATES_WAITING_FOR_RWLOCK",
-    0x00002000: "STATES_WAITING_FOR_JOIN_AT_EXIT",
-    0x00004000: "STATES_WAITING_FOR_JOIN",
-    0x00008000: "STATES_SUSPENDED",
-    0x00010000: "STATES_WAITING_FOR_SEGMENT",
-    0x00020000: "STATES_LIFE_IS_CHANGING",
-    0x08000000: "STATES_DEBUGGER",
-    0x10000000: "STATES_INTERRUPTIBLE_BY_SIGNAL",
-    0x20000000: "STATES_WAITING_FOR_RPC_REPLY",
-    0x40000000: "STATES_ZOMBIE",
-    0x80000000: "STATES_DORMANT",
+# gdb.Type codes as used by rtems_objects
+TYPE_CODES = {
+    gdb.TYPE_CODE_STRUCT: 'struct',
+    gdb.TYPE_CODE_UNION: 'union',
+    gdb.TYPE_CODE_PTR: 'ptr',
+    gdb.TYPE_CODE_INT: 'int',
+    gdb.TYPE_CODE_ENUM: 'enum',
+    gdb.TYPE_CODE_BOOL: 'bool',
+    gdb.TYPE_CODE_CHAR: 'char',
 }
 
-WAIT_CLASS = {
-    0x100: "THREAD_WAIT_CLASS_EVENT",
-    0x200: "THREAD_WAIT_CLASS_SYSTEM_EVENT",
-    0x400: "THREAD_WAIT_CLASS_OBJECT",
-    0x800: "THREAD_WAIT_CLASS_PERIOD",
-}
+class GdbType:
+    """
+    Adapts a gdb.Type to the type interface of rtems_objects.Target
+    """
+    def __init__(self, t):
+        self.t = t.strip_typedefs()
+        self.code = TYPE_CODES.get(self.t.code, 'other')
+        self.sizeof = self.t.sizeof
 
-OBJECT_CLASSES = {
+    @property
+    def is_signed(self) -> bool:
+        try:
+            return self.t.is_signed
+        except AttributeError:
+            # gdb < 12
+            name = self.t.name
+            return not (name is None or 'unsigned' in name or name.startswith('uint'))
 
-}
+    def fields(self) -> list:
+        return [(f.name, f.bitpos, GdbType(f.type)) for f in self.t.fields()]
 
-def _thr_state_name(state: int) -> str:
-    """
-    Convert a thread state to its associated name
-    
-    Parameters
-    ----------
-    state : int
-        State, comes from the thread control block
+
+class GdbTarget(Target):
     """
-    try:
-        return THREAD_STATES[state]
-    except:
-        return f'Invalid ({state})'
-        
-def _wait_class_flags(cls: int) -> list[str]:
+    The inferior gdb is currently debugging
     """
-    Converts the wait class of a thread into a list of named flags
+    @property
+    def little_endian(self) -> bool:
+        return 'little' in gdb.execute('show endian', to_string=True)
 
-    Parameters
-    ----------
-    cls : int
-        Wait class, as part of the Wait struct.
-    """
-    l = []
-    for k,v in WAIT_CLASS.items():
-        if cls & k: l.append(v)
-    return l
+    @property
+    def ptr_size(self) -> int:
+        return gdb.lookup_type('void').pointer().sizeof
+
+    def lookup_type(self, name: str):
+        # Some types (i.e. the RTL's) are only declared as struct tags
+        for n in (name, f'struct {name}'):
+            try:
+                return GdbType(gdb.lookup_type(n))
+            except gdb.error:
+                pass
+        return None
+
+    def symbol(self, name: str) -> int | None:
+        sym = gdb.lookup_global_symbol(name) or gdb.lookup_static_symbol(name)
+        return None if sym is None else int(sym.value().address)
+
+    def read(self, addr: int, size: int) -> bytes:
+        return gdb.selected_inferior().read_memory(addr, size)
 
-def _decode_name(name: int) -> str:
+
+def _gdb_errors(invoke):
+    """Reports RtemsErrors raised by a command as gdb errors, without a Python backtrace"""
+    @functools.wraps(invoke)
+    def wrapper(*args, **kwargs):
+        try:
+            return invoke(*args, **kwargs)
+        except RtemsError as e:
+            raise gdb.GdbError(str(e))
+    return wrapper
+
+
+class AddressIndex:
     """
-    Decodes a name into a printable string
+    Resolves addresses to function names using an ElfSymbols index per loaded objfile. Indexes are
+    kept per file and mtime, and results are cached per address. Addresses that aren't covered
+    (i.e. objfiles loaded at an offset, relocatable objects) fall back to gdb's own lookup.
     """
-    chrs = [(name>>24) & 0xFF,
-            (name>>16) & 0xFF,
-            (name>>8 ) & 0xFF,
-            (name>>0 ) & 0xFF]
-    return ''.join([chr(x) for x in chrs if x != 0])
+    def __init__(self):
+        self._files = {}
+        self._cache = {}
 
-def _object_class(id: int):
+    def clear(self, *args):
+        self._cache = {}
+
+    def _indexes(self) -> list[ElfSymbols]:
+        r = []
+        for o in gdb.objfiles():
+            if not o.filename or not os.path.isfile(o.filename):
+                continue
+            key = (o.filename, os.stat(o.filename).st_mtime_ns)
+            if key not in self._files:
+                try:
+                    self._files[key] = ElfSymbols(o.filename)
+                except (OSError, struct.error, ValueError):
+                    self._files[key] = None
+            if self._files[key] is not None and len(self._files[key].addrs) > 0:
+                r.append(self._files[key])
+        return r
+
+    def lookup(self, addr: int) -> str:
+        """Returns the function name for addr, or the address in hex if it can't be resolved"""
+        if addr in self._cache:
+            return self._cache[addr]
+        name = None
+        for idx in self._indexes():
+            name = idx.lookup(addr)
+            if name is not None:
+                break
+        if name is None:
+            try:
+                b = gdb.block_for_pc(addr)
+                while b is not None and b.function is None:
+                    b = b.superblock
+                if b is not None:
+                    name = b.function.name
+            except RuntimeError:
+                pass
+        self._cache[addr] = name if name is not None else hex(addr)
+        return self._cache[addr]
+
+
+_session = Session(GdbTarget())
+gdb.events.stop.connect(_session.invalidate_memory)
+gdb.events.memory_changed.connect(_session.invalidate_memory)
+gdb.events.new_objfile.connect(_session.invalidate_types)
+gdb.events.clear_objfiles.connect(_session.invalidate_types)
+
+_addr_index = AddressIndex()
+gdb.events.new_objfile.connect(_addr_index.clear)
+gdb.events.clear_objfiles.connect(_addr_index.clear)
+
+def _run_for(seconds: float):
     """
-    Extract object class from objects id
+    Lets the target run for the given time and stops it again. A timer delivers a SIGINT to gdb
+    itself while 'continue' runs, which gdb turns into an interrupt of the target (this also works
+    for remote targets).
     """
-    return (id >> 27) & 0x1F
+    timer = threading.Timer(seconds, lambda: os.kill(os.getpid(), signal.SIGINT))
+    timer.start()
+    try:
+        gdb.execute('continue', to_string=True)
+    finally:
+        timer.cancel()
+
 
 class RtemsTasksCommand(gdb.Command):
     """
@@ -95,65 +172,360 @@ class RtemsTasksCommand(gdb.Command):
     def __init__(self):
         super().__init__('rtems tasks', gdb.COMMAND_USER)
     
-    def _iterate_tasks(self):
-        """
-        Iterate tasks and print info about them
-        """
-        i = 0
-        while True:
-            # Grab the object
-            obj = gdb.parse_and_eval(f'_RTEMS_tasks_Information.Objects.local_table[{i}]')
-            # Cast to thread control structure
-            ctrl = obj.cast(gdb.lookup_type('Thread_Control').pointer())
-
-            # Instruction pointer is on the top of the stack
-            reg = ctrl['Registers']['esp']
-            pc = reg.cast(gdb.lookup_type('uint32_t').pointer()).dereference() if int(reg) != 0 else 0
-
-            name = _decode_name(obj['name']['name_u32'])
-            print(f'{name} -->')
-            print(f'  State: {_thr_state_name(int(ctrl["current_state"]))}')
-            print(f'  Wait State:')
-            print(f'    Class: {", ".join(_wait_class_flags(ctrl["Wait"]["flags"]))}')
-            print(f'  PC: {hex(pc)}')
-            if int(obj['Node']['next']) == 0 or i > 128:
-                break
-            i += 1
-    
+    @_gdb_errors
     def invoke(self, argument, from_tty):
-        self._iterate_tasks()
+        print_tasks(_session)
 
 
 class RtemsSemaphoresCommand(gdb.Command):
     def __init__(self):
         super().__init__('rtems sem', gdb.COMMAND_USER)
     
-    def _iterate_sems(self, locked_only: bool):
-        # Head node
-        node = gdb.parse_and_eval('_Semaphore_Objects[0]')
-        while True:
-            # Grab the core control union
-            ctrl = node['Core_control']
-            # Grab the wait queue. This is at the same offset for all types in the union
-            wait_q = ctrl['Semaphore']['Wait_queue']['Queue']
-
-            is_locked = wait_q['owner'] != 0
-
-            if locked_only and is_locked or not locked_only:
-                name = _decode_name(int(node["Object"]["name"]["name_u32"]))
-                print(f'{name if len(name) else '<unnamed>'} -->')
-                print(f'  Status: {"Locked" if is_locked else "Unlocked"}')
-                if is_locked:
-                    print(f'    Owner: {wait_q["owner"].cast(gdb.lookup_type('Thread_Control').pointer())}')
-
-            # Next node
-            next = node['Object']['Node']['next']
-            if int(next) == 0: break
-            node = next.cast(gdb.lookup_type('Semaphore_Control').pointer())
-
+    @_gdb_errors
     def invoke(self, arg, from_tty):
-        self._iterate_sems(arg=='locked')
+        print_semaphores(_session, arg=='locked')
+
+
+class RtemsProfileCommand(gdb.Command):
+    """
+    Statistical profiler. Lets the target run and interrupts it periodically, recording the
+    executing thread and its PC (or backtrace) at each stop.
+
+    Usage: rtems profile [-d SECONDS] [-r HZ] [-b DEPTH] [-n TOP] [-o FILE]
+      -d  Duration to profile for, defaults to 10 seconds
+      -r  Sample rate, defaults to 20 Hz
+      -b  Record backtraces up to DEPTH frames instead of just the PC
+      -n  Number of functions to show per task, defaults to 10
+      -o  Write the samples as folded stacks (task;outer;...;inner count), for flamegraph.pl
+    """
+    def __init__(self):
+        super().__init__('rtems profile', gdb.COMMAND_USER)
+
+    def _executing(self) -> int | None:
+        """Returns the address of the executing thread on CPU 0"""
+        addr = _session.symbol('_Per_CPU_Information')
+        f = _session.types.field('Per_CPU_Control_envelope', 'per_cpu.executing')
+        if addr is None or f is None:
+            return None
+        return _session.word(_session.mem.read(addr + f[0], f[1]))
+
+    def _thread_name(self, thread: int | None, names: dict) -> str:
+        if thread is None or thread == 0:
+            return '<none>'
+        if thread not in names:
+            st = _session.struct('Thread_Control', THREAD_FIELDS)
+            try:
+                names[thread] = _decode_name(st.decode(_session.mem.read(thread, st.size))['name']) or hex(thread)
+            except gdb.MemoryError:
+                names[thread] = hex(thread)
+        return names[thread]
+
+    def _sample(self, depth: int) -> list[int]:
+        """PCs of the current stack, innermost first"""
+        pcs = []
+        frame = gdb.newest_frame()
+        while frame is not None and len(pcs) < depth:
+            pcs.append(frame.pc())
+            try:
+                frame = frame.older()
+            except gdb.error:
+                break
+        return pcs
+
+    @_gdb_errors
+    def invoke(self, argument, from_tty):
+        argv = gdb.string_to_argv(argument)
+        opts = {'-d': '10', '-r': '20', '-b': None, '-n': '10', '-o': None}
+        while len(argv) > 0:
+            k = argv.pop(0)
+            if k not in opts or len(argv) == 0:
+                raise gdb.GdbError('Usage: rtems profile [-d SECONDS] [-r HZ] [-b DEPTH] [-n TOP] [-o FILE]')
+            opts[k] = argv.pop(0)
+
+        duration, rate = float(opts['-d']), float(opts['-r'])
+        depth = 1 if opts['-b'] is None else int(opts['-b'])
+        count = max(1, int(duration * rate))
+
+        samples = {}
+        names = {}
+        for _ in range(count):
+            _run_for(1.0 / rate)
+            thread = self._thread_name(self._executing(), names)
+            key = (thread,) + tuple(self._sample(depth))
+            samples[key] = samples.get(key, 0) + 1
+
+        total = sum(samples.values())
+        print(f'{total} samples over {duration}s')
+
+        if opts['-o'] is not None:
+            with open(opts['-o'], 'w') as fp:
+                for key, n in samples.items():
+                    frames = [_addr_index.lookup(x) for x in reversed(key[1:])]
+                    # ';' separates frames and ' ' the count, neither may appear in the thread name
+                    thread = key[0].replace(';', '_').replace(' ', '_')
+                    fp.write(';'.join([thread] + frames) + f' {n}\n')
+            print(f'Wrote folded stacks to {opts["-o"]}')
+
+        # Top functions per task, by the innermost frame
+        per_task = {}
+        for key, n in samples.items():
+            funcs = per_task.setdefault(key[0], {})
+            fn = _addr_index.lookup(key[1]) if len(key) > 1 else '?'
+            funcs[fn] = funcs.get(fn, 0) + n
+        for task, funcs in sorted(per_task.items(), key=lambda x: -sum(x[1].values())):
+            tn = sum(funcs.values())
+            print(f'{task}: {tn} samples ({100.0 * tn / total:.1f}%)')
+            for fn, n in sorted(funcs.items(), key=lambda x: -x[1])[:int(opts['-n'])]:
+                print(f'  {100.0 * n / total:6.1f}%  {n:6d}  {fn}')
+
+
+class RtemsCpuUseCommand(gdb.Command):
+    """
+    Per task CPU usage. Lets the target run for an interval and reports the share of the CPU time
+    each thread got in it, from the difference of two snapshots of the thread's CPU time counters.
+
+    Usage: rtems cpuuse [-i SECONDS] [-c COUNT]
+      -i  Interval to let the target run for, defaults to 1 second
+      -c  Number of consecutive intervals to report, defaults to 1
+
+    The time the executing thread spent since its last context switch is only accounted at the
+    next switch, so very short intervals will be skewed towards threads that block often.
+    """
+    def __init__(self):
+        super().__init__('rtems cpuuse', gdb.COMMAND_USER)
+
+    def _fields(self) -> dict[str, str]:
+        return {'id': 'Object.id', 'name': 'Object.name.name_u32', **CPU_TIME_FIELDS}
+
+    def _threads(self) -> dict[int, dict]:
+        """Reads the id, name and CPU time of all threads. Returns address -> fields."""
+        r = {}
+        for info in THREAD_INFORMATION:
+            for a, t in _session.read_objects(info, 'Thread_Control', self._fields()):
+                r[a] = t
+        return r
+
+    def _snapshot(self, threads: dict[int, dict]) -> dict[int, int | None]:
+        """
+        Re-reads only the CPU time counters of known threads. The counters are close together in
+        the object tables, so this costs about one read per object class.
+        """
+        st = _session.struct('Thread_Control', self._fields())
+        counters = {k: st.fields[k] for k in CPU_TIME_FIELDS if st.fields[k] is not None}
+        if len(counters) == 0:
+            raise gdb.GdbError('Thread_Control has no cpu_time_used, CPU usage accounting not available')
+        lo = min(f[0] for f in counters.values())
+        hi = max(f[0] + struct.calcsize(f[1]) for f in counters.values())
+        data = _session.mem.read_ranges([(a + lo, hi - lo) for a in threads])
+
+        r = {}
+        for a in threads:
+            d = data.get((a + lo, hi - lo))
+            if d is None:
+                r[a] = None
+                continue
+            t = dict.fromkeys(CPU_TIME_FIELDS)
+            for k, f in counters.items():
+                t[k] = struct.unpack_from(f[1], d, f[0] - lo)[0]
+            r[a] = _cpu_time_ns(t)
+        return r
+
+    def _report(self, threads: dict[int, dict], before: dict, after: dict):
+        deltas = {a: after[a] - before[a] for a in threads
+                  if before.get(a) is not None and after.get(a) is not None}
+        total = sum(deltas.values())
+        if total <= 0:
+            print('No CPU time accounted in the interval')
+            return
+
+        idle = 0
+        print(f'{"ID":<10} {"NAME":<8} {"TIME (ms)":>10} {"CPU %":>7}')
+        for a, d in sorted(deltas.items(), key=lambda x: -x[1]):
+            name = _decode_name(threads[a]['name'])
+            if name.rstrip() == 'IDLE':
+                idle += d
+            print(f'{threads[a]["id"]:#010x} {name:<8} {d / 1e6:10.3f} {100.0 * d / total:6.2f}%')
+        print(f'Total: {total / 1e6:.3f} ms, idle: {100.0 * idle / total:.2f}%')
+
+    @_gdb_errors
+    def invoke(self, argument, from_tty):
+        argv = gdb.string_to_argv(argument)
+        opts = {'-i': '1', '-c': '1'}
+        while len(argv) > 0:
+            k = argv.pop(0)
+            if k not in opts or len(argv) == 0:
+                raise gdb.GdbError('Usage: rtems cpuuse [-i SECONDS] [-c COUNT]')
+            opts[k] = argv.pop(0)
+
+        threads = self._threads()
+        before = {a: _cpu_time_ns(t) for a, t in threads.items()}
+        for i in range(int(opts['-c'])):
+            _run_for(float(opts['-i']))
+            after = self._snapshot(threads)
+            if i > 0:
+                print()
+            self._report(threads, before, after)
+            before = after
+
+
+class RtemsSnapshotCommand(gdb.Command):
+    """
+    Writes the state of the (halted) system to a JSON file for offline analysis: tasks with
+    registers and stack usage, semaphores, message queues, timers and wait queues.
+
+    Usage: rtems snapshot FILE
+    """
+    def __init__(self):
+        super().__init__('rtems snapshot', gdb.COMMAND_USER, gdb.COMPLETE_FILENAME)
+
+    @_gdb_errors
+    def invoke(self, argument, from_tty):
+        argv = gdb.string_to_argv(argument)
+        if len(argv) != 1:
+            raise gdb.GdbError('Usage: rtems snapshot FILE')
+
+        reads = _session.mem.reads
+        snap = snapshot(_session)
+        with open(argv[0], 'w') as fp:
+            json.dump(snap, fp, indent=1)
+        print(f'Wrote {len(snap["tasks"])} tasks, {len(snap["semaphores"])} semaphores, '
+              f'{len(snap["message_queues"])} message queues, {len(snap["timers"])} timers to {argv[0]} '
+              f'({_session.mem.reads - reads} target reads)')
+
+
+class RtemsHeapCommand(gdb.Command):
+    """
+    Shows usage and fragmentation of the C program heap and the RTEMS workspace. The block list is
+    read in large chunks and walked on the host.
+
+    Usage: rtems heap [-n TOP]
+      -n  Number of most common allocation sizes to show, defaults to 10
+    """
+    def __init__(self):
+        super().__init__('rtems heap', gdb.COMMAND_USER)
+
+    @_gdb_errors
+    def invoke(self, argument, from_tty):
+        argv = gdb.string_to_argv(argument)
+        if len(argv) not in (0, 2) or (len(argv) == 2 and argv[0] != '-n'):
+            raise gdb.GdbError('Usage: rtems heap [-n TOP]')
+        print_heaps(_session, int(argv[1]) if len(argv) == 2 else 10)
+
+
+# Section header flag of sections that occupy memory
+SHF_ALLOC = 0x2
+
+class RtemsRtlSymbolsCommand(gdb.Command):
+    """
+    Loads the symbols of objects loaded at runtime by the RTL (libdl). The object list is read from
+    the target, host files with the same names are searched for in the search path and added with
+    add-symbol-file at the addresses the sections were loaded to.
+
+    Usage: rtems rtl-symbols [-d DIR]... [-n]
+      -d  Directory to search (recursively) for the host object files. The directories in
+          RTEMS_RTL_PATH and the current directory are always searched.
+      -n  Only show the add-symbol-file commands
+    """
+    def __init__(self):
+        super().__init__('rtems rtl-symbols', gdb.COMMAND_USER)
+        # (path, mtime, size) -> names of the allocated sections
+        self._sections = {}
+        # directory -> {file name: [paths]}
+        self._dirs = {}
+        # path -> add-symbol-file command it was loaded with. Cleared with the symbol files
+        # (file, symbol-file, ...), nothing is left to remove then
+        self._loaded = {}
+        gdb.events.clear_objfiles.connect(self._clear)
+
+    def _clear(self, event=None):
+        self._loaded = {}
+
+    @staticmethod
+    def _quote(path: str) -> str:
+        """Quotes a path for gdb commands taking file names, i.e. with spaces in them"""
+        return '"' + path.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+    def _index(self, dir: str, refresh: bool = False) -> dict[str, list[str]]:
+        if refresh or dir not in self._dirs:
+            files = {}
+            for root, _, names in os.walk(dir):
+                for n in names:
+                    files.setdefault(n, []).append(os.path.join(root, n))
+            self._dirs[dir] = files
+        return self._dirs[dir]
+
+    def _find(self, name: str, dirs: list[str]) -> str | None:
+        """Finds a host file by name, rescanning the search path once if it isn't known"""
+        for refresh in (False, True):
+            for d in dirs:
+                paths = self._index(d, refresh).get(name)
+                if paths:
+                    return sorted(paths)[0]
+        return None
+
+    def _alloc_sections(self, path: str) -> set[str]:
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+        if key not in self._sections:
+            with open(path, 'rb') as fp:
+                self._sections[key] = {x[0] for x in elf_sections(fp.read()) if x[2] & SHF_ALLOC}
+        return self._sections[key]
+
+    @_gdb_errors
+    def invoke(self, argument, from_tty):
+        argv = gdb.string_to_argv(argument)
+        dirs, dry_run = [], False
+        while len(argv) > 0:
+            k = argv.pop(0)
+            if k == '-n':
+                dry_run = True
+            elif k == '-d' and len(argv) > 0:
+                dirs.append(argv.pop(0))
+            else:
+                raise gdb.GdbError('Usage: rtems rtl-symbols [-d DIR]... [-n]')
+        dirs += [x for x in os.environ.get('RTEMS_RTL_PATH', '').split(os.pathsep) if x] + ['.']
+        dirs = [os.path.abspath(x) for x in dirs if os.path.isdir(x)]
+
+        objs = rtl_objects(_session)
+        if len(objs) == 0:
+            print('No objects loaded by the RTL')
+            return
+
+        cmds = []
+        for o in objs:
+            path = self._find(os.path.basename(o['name']), dirs)
+            if path is None:
+                print(f'{o["name"]}: not found in the search path')
+                continue
+            have = self._alloc_sections(path)
+            secs = {s['name']: s['base'] for s in o['sections'] if s['base'] and s['name'] in have}
+            text = secs.pop('.text', o['text_base'])
+            cmd = f'add-symbol-file {self._quote(path)} {hex(text)}' + ''.join([f' -s {k} {hex(v)}' for k, v in secs.items()])
+            if self._loaded.get(path) == cmd:
+                continue
+            cmds.append((path, cmd))
+
+        for path, cmd in cmds:
+            print(cmd)
+            if dry_run:
+                continue
+            # Loaded at a different address before, i.e. the target was restarted
+            if path in self._loaded:
+                try:
+                    gdb.execute(f'remove-symbol-file {self._quote(path)}', to_string=True)
+                except gdb.error:
+                    # Already gone, e.g. removed by hand
+                    pass
+            gdb.execute(cmd, to_string=True)
+            self._loaded[path] = cmd
+        print(f'{len(objs)} objects, {len(cmds)} symbol files {"to load" if dry_run else "loaded"}')
+
 
 RtemsCommand()
 RtemsTasksCommand()
-RtemsSemaphoresCommand()
\ No newline at end of file
+RtemsSemaphoresCommand()
+RtemsProfileCommand()
+RtemsCpuUseCommand()
+RtemsSnapshotCommand()
+RtemsHeapCommand()
+RtemsRtlSymbolsCommand()
@@ -0,0 +1,1178 @@
+#!/usr/bin/env python3
+"""
+Decoding of RTEMS objects from target memory, independent of gdb. The gdb commands in rtems.py
+run this against the live target, rtems-dump.py against core files and memory images.
+"""
+
+import struct
+import bisect
+
+
+class RtemsError(Exception):
+    """Errors decoding RTEMS state, i.e. missing types or unreadable memory"""
+
+
+class Target:
+    """
+    Access to the memory, symbols and types of an RTEMS system. Implemented by rtems.GdbTarget for
+    live targets and by rtems-dump.py for dumps.
+
+    Types returned by lookup_type have typedefs stripped and provide:
+      code      -- one of 'struct', 'union', 'ptr', 'int', 'enum', 'bool', 'char' or anything else
+      sizeof    -- size in bytes
+      is_signed -- for integer types
+      fields()  -- list of (name, bitpos, type) of a struct or union, name is None for anonymous members
+    """
+    @property
+    def little_endian(self) -> bool:
+        raise NotImplementedError()
+
+    @property
+    def ptr_size(self) -> int:
+        raise NotImplementedError()
+
+    def lookup_type(self, name: str):
+        """Returns the type called name, or None if it doesn't exist"""
+        raise NotImplementedError()
+
+    def symbol(self, name: str) -> int | None:
+        """Returns the address of a global or static symbol, or None if it doesn't exist"""
+        raise NotImplementedError()
+
+    def read(self, addr: int, size: int) -> bytes:
+        """Reads target memory, raises on unreadable addresses"""
+        raise NotImplementedError()
+
+THREAD_STATES = {
+    0x00000000: "STATES_READY",
+    0x00000001: "STATES_WAITING_FOR_MUTEX",
+    0x00000002: "STATES_WAITING_FOR_SEMAPHORE",
+    0x00000004: "STATES_WAITING_FOR_EVENT",
+    0x00000008: "STATES_WAITING_FOR_SYSTEM_EVENT",
+    0x00000010: "STATES_WAITING_FOR_MESSAGE",
+    0x00000020: "STATES_WAITING_FOR_CONDITION_VARIABLE",
+    0x00000040: "STATES_WAITING_FOR_FUTEX",
+    0x00000080: "STATES_WAITING_FOR_BSD_WAKEUP",
+    0x00000100: "STATES_WAITING_FOR_TIME",
+    0x00000200: "STATES_WAITING_FOR_PERIOD",
+    0x00000400: "STATES_WAITING_FOR_SIGNAL",
+    0x00000800: "STATES_WAITING_FOR_BARRIER",
+    0x00001000: "STATES_WAITING_FOR_RWLOCK",
+    0x00002000: "STATES_WAITING_FOR_JOIN_AT_EXIT",
+    0x00004000: "STATES_WAITING_FOR_JOIN",
+    0x00008000: "STATES_SUSPENDED",
+    0x00010000: "STATES_WAITING_FOR_SEGMENT",
+    0x00020000: "STATES_LIFE_IS_CHANGING",
+    0x08000000: "STATES_DEBUGGER",
+    0x10000000: "STATES_INTERRUPTIBLE_BY_SIGNAL",
+    0x20000000: "STATES_WAITING_FOR_RPC_REPLY",
+    0x40000000: "STATES_ZOMBIE",
+    0x80000000: "STATES_DORMANT",
+}
+
+WAIT_CLASS = {
+    0x100: "THREAD_WAIT_CLASS_EVENT",
+    0x200: "THREAD_WAIT_CLASS_SYSTEM_EVENT",
+    0x400: "THREAD_WAIT_CLASS_OBJECT",
+    0x800: "THREAD_WAIT_CLASS_PERIOD",
+}
+
+OBJECT_CLASSES = {
+
+}
+
+def _thr_state_name(state: int) -> str:
+    """
+    Convert a thread state to its associated name
+    
+    Parameters
+    ----------
+    state : int
+        State, comes from the thread control block
+    """
+    try:
+        return THREAD_STATES[state]
+    except:
+        return f'Invalid ({state})'
+        
+def _wait_class_flags(cls: int) -> list[str]:
+    """
+    Converts the wait class of a thread into a list of named flags
+
+    Parameters
+    ----------
+    cls : int
+        Wait class, as part of the Wait struct.
+    """
+    l = []
+    for k,v in WAIT_CLASS.items():
+        if cls & k: l.append(v)
+    return l
+
+def _decode_name(name: int) -> str:
+    """
+    Decodes a name into a printable string
+    """
+    chrs = [(name>>24) & 0xFF,
+            (name>>16) & 0xFF,
+            (name>>8 ) & 0xFF,
+            (name>>0 ) & 0xFF]
+    return ''.join([chr(x) for x in chrs if x != 0])
+
+def _object_class(id: int):
+    """
+    Extract object class from objects id
+    """
+    return (id >> 27) & 0x1F
+
+#
+# Bulk-read object engine.
+# Types, sizes and field offsets are looked up once and cached until the symbols change. Target
+# memory is read in as few Target.read calls as possible, decoded on the host with struct, and
+# cached until the target runs again or is written to.
+#
+
+# Adjacent reads closer than this are merged into one
+READ_GAP = 4096
+# Largest single read
+READ_MAX = 1024 * 1024
+# Linked objects are read with this much of the memory following them, so the next objects on the
+# list usually come from the cache
+READ_PREFETCH = 4096
+# Longest string read
+STRING_MAX = 256
+
+class Types:
+    """
+    Cache of type sizes and field offsets
+
+    Parameters
+    ----------
+    target : Target
+        Target to look types up in
+    """
+    def __init__(self, target: Target):
+        self.target = target
+        self.clear()
+
+    def clear(self):
+        self._types = {}
+        self._fields = {}
+        self._little = None
+        self._ptr_size = None
+
+    @property
+    def little_endian(self) -> bool:
+        if self._little is None:
+            self._little = self.target.little_endian
+        return self._little
+
+    @property
+    def ptr_size(self) -> int:
+        if self._ptr_size is None:
+            self._ptr_size = self.target.ptr_size
+        return self._ptr_size
+
+    def lookup(self, name: str):
+        """Returns the (typedef stripped) type for name, or None if there's no such type"""
+        if name not in self._types:
+            self._types[name] = self.target.lookup_type(name)
+        return self._types[name]
+
+    def sizeof(self, name: str) -> int:
+        t = self.lookup(name)
+        if t is None:
+            raise RtemsError(f'Type {name} not found, are RTEMS debug symbols loaded?')
+        return t.sizeof
+
+    @staticmethod
+    def _find_field(t, name: str):
+        """Finds a field by name, looking through anonymous structs/unions. Returns (type, bitpos)"""
+        for fname, bitpos, ft in t.fields():
+            if fname == name:
+                return ft, bitpos
+            if fname is None or fname == '':
+                if ft.code in ('struct', 'union'):
+                    r = Types._find_field(ft, name)
+                    if r is not None:
+                        return r[0], bitpos + r[1]
+        return None
+
+    @staticmethod
+    def _kind(t) -> str:
+        """Classifies a type for decoding: 'u', 's', 'p' or 'raw'"""
+        if t.code == 'ptr':
+            return 'p'
+        if t.code in ('int', 'enum', 'bool', 'char'):
+            return 's' if t.is_signed else 'u'
+        return 'raw'
+
+    def field(self, type_name: str, path: str) -> tuple[int, int, str] | None:
+        """
+        Looks up a (dotted) field path in a struct
+
+        Parameters
+        ----------
+        type_name : str
+            Name of the struct type, i.e. Thread_Control
+        path : str
+            Dotted path to the field, i.e. Object.name.name_u32
+
+        Returns
+        -------
+        tuple[int, int, str] | None :
+            (offset, size, kind) of the field, or None if it doesn't exist in this RTEMS version
+        """
+        key = (type_name, path)
+        if key in self._fields:
+            return self._fields[key]
+
+        t = self.lookup(type_name)
+        off = 0
+        for comp in path.split('.'):
+            if t is None or t.code not in ('struct', 'union'):
+                t = None
+                break
+            r = self._find_field(t, comp)
+            if r is None:
+                t = None
+                break
+            off += r[1] // 8
+            t = r[0]
+
+        self._fields[key] = None if t is None else (off, t.sizeof, self._kind(t))
+        return self._fields[key]
+
+
+class Memory:
+    """
+    Cached target memory reads.
+
+    Parameters
+    ----------
+    read : callable
+        read(addr, size) -> bytes, reads target memory
+    """
+    def __init__(self, read):
+        self._read = read
+        self.clear()
+
+    def clear(self):
+        # List of (start, bytes) chunks read since the last invalidation
+        self._chunks = []
+        self.reads = 0
+
+    def _cached(self, addr: int, size: int) -> bytes | None:
+        for start, data in self._chunks:
+            if start <= addr and addr + size <= start + len(data):
+                return data[addr - start:addr - start + size]
+        return None
+
+    def read(self, addr: int, size: int, prefetch: int = 0) -> bytes:
+        """Reads size bytes at addr. If it isn't cached, reads (and caches) up to prefetch bytes."""
+        data = self._cached(addr, size)
+        if data is None:
+            if prefetch > size:
+                try:
+                    data = bytes(self._read(addr, prefetch))
+                except Exception:
+                    # i.e. at the end of memory
+                    data = None
+            if data is None:
+                data = bytes(self._read(addr, size))
+            self.reads += 1
+            self._chunks.append((addr, data))
+        return data[:size]
+
+    def read_many(self, addrs: list[int], size: int) -> dict[int, bytes]:
+        """
+        Reads size bytes at each of addrs. Nearby areas are merged into a single read, so objects
+        allocated from the same block (the usual case for RTEMS object tables) cost one round trip.
+
+        Returns
+        -------
+        dict[int, bytes] :
+            Mapping of address -> data. Unreadable addresses are left out.
+        """
+        return {k[0]: v for k, v in self.read_ranges([(a, size) for a in addrs]).items()}
+
+    def read_ranges(self, ranges: list[tuple[int, int]]) -> dict[tuple[int, int], bytes]:
+        """
+        Reads a list of (addr, size) ranges, merging nearby ones like read_many
+
+        Returns
+        -------
+        dict[tuple[int, int], bytes] :
+            Mapping of (addr, size) -> data. Unreadable ranges are left out.
+        """
+        result = {}
+        todo = []
+        for a, n in sorted(set(ranges)):
+            data = self._cached(a, n)
+            if data is not None:
+                result[(a, n)] = data
+            else:
+                todo.append((a, n))
+
+        # Group into runs
+        runs = []
+        for a, n in todo:
+            if len(runs) > 0 and a - runs[-1][1] <= READ_GAP and a + n - runs[-1][0] <= READ_MAX:
+                runs[-1][1] = max(runs[-1][1], a + n)
+                runs[-1][2].append((a, n))
+            else:
+                runs.append([a, a + n, [(a, n)]])
+
+        for start, end, members in runs:
+            try:
+                data = self.read(start, end - start)
+            except Exception:
+                # Part of the run isn't readable, fall back to the individual ranges
+                for a, n in members:
+                    try:
+                        result[(a, n)] = self.read(a, n)
+                    except Exception:
+                        pass
+                continue
+            for a, n in members:
+                result[(a, n)] = data[a - start:a - start + n]
+        return result
+
+
+class Struct:
+    """
+    Decodes a set of fields of a struct from raw memory
+
+    Parameters
+    ----------
+    types : Types
+        Type cache
+    type_name : str
+        Name of the struct type
+    fields : dict[str, str]
+        Mapping of key -> dotted field path. Fields missing in this RTEMS version decode as None.
+    """
+    _FMT = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+    def __init__(self, types: Types, type_name: str, fields: dict[str, str]):
+        self.type_name = type_name
+        self.size = types.sizeof(type_name)
+        self.endian = '<' if types.little_endian else '>'
+        self.fields = {}
+        for k, path in fields.items():
+            f = types.field(type_name, path)
+            if f is not None and f[2] != 'raw' and f[1] in self._FMT:
+                fmt = self._FMT[f[1]]
+                self.fields[k] = (f[0], self.endian + (fmt.lower() if f[2] == 's' else fmt))
+            else:
+                self.fields[k] = None
+
+    def offset(self, key: str) -> int | None:
+        f = self.fields[key]
+        return None if f is None else f[0]
+
+    def decode(self, data: bytes, base: int = 0) -> dict:
+        """Decodes the fields from data, with the struct starting at data[base]"""
+        r = {}
+        for k, f in self.fields.items():
+            r[k] = None if f is None else struct.unpack_from(f[1], data, base + f[0])[0]
+        return r
+
+
+class Session:
+    """
+    Shared state of the rtems commands: type cache and target memory cache
+
+    Parameters
+    ----------
+    target : Target
+        System to decode
+    """
+    def __init__(self, target: Target):
+        self.target = target
+        self.types = Types(target)
+        self.mem = Memory(target.read)
+        self._structs = {}
+        self._symbols = {}
+        self._arch = None
+
+    def invalidate_memory(self, *args):
+        self.mem.clear()
+
+    def invalidate_types(self, *args):
+        self.types.clear()
+        self._structs = {}
+        self._symbols = {}
+        self._arch = None
+        self.mem.clear()
+
+    @property
+    def arch(self):
+        """Context decoder for the target architecture, see ArchContext"""
+        if self._arch is None:
+            self._arch = ArchContext(self)
+        return self._arch
+
+    def word(self, data: bytes, off: int = 0) -> int:
+        """Decodes a pointer sized word"""
+        psz = self.types.ptr_size
+        return int.from_bytes(data[off:off + psz], 'little' if self.types.little_endian else 'big')
+
+    def struct(self, type_name: str, fields: dict[str, str]) -> Struct:
+        """Returns a (cached) Struct decoder"""
+        key = (type_name, tuple(fields.items()))
+        if key not in self._structs:
+            self._structs[key] = Struct(self.types, type_name, fields)
+        return self._structs[key]
+
+    def symbol(self, name: str) -> int | None:
+        """Returns the address of a global symbol, or None if it doesn't exist"""
+        if name not in self._symbols:
+            self._symbols[name] = self.target.symbol(name)
+        return self._symbols[name]
+
+    def read_ptrs(self, addr: int, count: int) -> list[int]:
+        """Reads an array of count pointers"""
+        psz = self.types.ptr_size
+        fmt = ('<' if self.types.little_endian else '>') + str(count) + ('I' if psz == 4 else 'Q')
+        return list(struct.unpack(fmt, self.mem.read(addr, count * psz)))
+
+    def read_objects(self, info: str, type_name: str, fields: dict[str, str]) -> list[tuple[int, dict]]:
+        """
+        Reads all active objects of an object class
+
+        Parameters
+        ----------
+        info : str
+            Name of the Objects_Information symbol, i.e. _RTEMS_tasks_Information
+        type_name : str
+            Control block type, i.e. Thread_Control
+        fields : dict[str, str]
+            Fields to decode, see Struct
+
+        Returns
+        -------
+        list[tuple[int, dict]] :
+            (address, decoded fields) of each active object, in table order. Objects that can't be
+            read (i.e. not in a memory dump) are left out.
+        """
+        addr = self.symbol(info)
+        if addr is None:
+            return []
+        oi = self.struct('Objects_Information', {'maximum_id': 'maximum_id', 'local_table': 'local_table'})
+        hdr = oi.decode(self.mem.read(addr, oi.size))
+        count = hdr['maximum_id'] & 0xFFFF
+        if count == 0 or hdr['local_table'] == 0:
+            return []
+
+        ptrs = [x for x in self.read_ptrs(hdr['local_table'], count) if x != 0]
+        st = self.struct(type_name, fields)
+        blocks = self.mem.read_many(ptrs, st.size)
+        return [(p, st.decode(blocks[p])) for p in ptrs if p in blocks]
+
+    def read_chain(self, chain: int, type_name: str, node: str, fields: dict[str, str]) -> list[tuple[int, dict]]:
+        """
+        Reads the objects on a Chain_Control. A list has to be followed node by node, but each
+        object is read with READ_PREFETCH bytes after it, so objects allocated close together
+        cost one round trip.
+
+        Parameters
+        ----------
+        chain : int
+            Address of the Chain_Control
+        type_name : str
+            Type of the objects on the chain
+        node : str
+            Path of the Chain_Node in the objects
+        fields : dict[str, str]
+            Fields to decode, see Struct
+
+        Returns
+        -------
+        list[tuple[int, dict]] :
+            (address, decoded fields) of each object, in chain order
+        """
+        psz = self.types.ptr_size
+        tail = self.types.field('Chain_Control', 'Tail.Node')
+        tail = chain + (psz if tail is None else tail[0])
+        noff = self.types.field(type_name, node)
+        if noff is None:
+            raise RtemsError(f'{type_name} has no {node}')
+        st = self.struct(type_name, {**fields, '_next': node + '.next'})
+
+        result = []
+        seen = set()
+        n = self.word(self.mem.read(chain, psz))
+        while n and n != tail and n not in seen:
+            seen.add(n)
+            obj = n - noff[0]
+            r = st.decode(self.mem.read(obj, st.size, READ_PREFETCH))
+            n = r.pop('_next')
+            result.append((obj, r))
+        return result
+
+    def read_strings(self, addrs: list[int]) -> dict[int, str]:
+        """Reads NUL terminated strings of up to STRING_MAX bytes, merging nearby reads"""
+        data = self.mem.read_ranges([(a, STRING_MAX) for a in addrs if a])
+        result = {}
+        for a in addrs:
+            d = data.get((a, STRING_MAX))
+            if d is None and a:
+                # Probably close to the end of memory, try the string on its own
+                try:
+                    d = self.mem.read(a, 1)
+                    while d[-1] != 0 and len(d) < STRING_MAX:
+                        d += self.mem.read(a + len(d), 1)
+                except Exception:
+                    d = None
+            result[a] = '' if d is None else d.split(b'\0', 1)[0].decode(errors='replace')
+        return result
+
+
+# Where the PC and SP of a switched out thread live in Context_Control, checked in order.
+# A PC of None means the context switch was a call and the return address is at the top of the stack.
+# (arch, field identifying the layout, SP field, PC field)
+CONTEXT_LAYOUTS = [
+    ('aarch64', 'register_x19', 'register_sp', 'register_lr'),
+    ('arm', 'register_lr', 'register_sp', 'register_lr'),
+    ('i386', 'esp', 'esp', None),
+    ('m68k', 'a7_msp', 'a7_msp', None),
+]
+
+# PowerPC keeps a cache line aligned ppc_context inside Context_Control.context[], see ppc_get_context()
+PPC_DEFAULT_CACHE_LINE_SIZE = 32
+
+class ArchContext:
+    """
+    Decodes the saved PC and SP of switched out threads from Thread_Control.Registers.
+    Supports i386, ARM, PowerPC, m68k and AArch64. The other integer fields of the context can
+    be decoded as well, see contexts.
+    """
+    def __init__(self, session: Session):
+        self.session = session
+        self.name = None
+        self.all = None
+        types = session.types
+        reg = types.field('Thread_Control', 'Registers')
+        self.regs_off = None if reg is None else reg[0]
+
+        for arch, ident, sp, pc in CONTEXT_LAYOUTS:
+            if types.field('Context_Control', ident) is not None:
+                self.name = arch
+                self.st = session.struct('Context_Control', {'sp': sp, 'pc': pc or sp})
+                self.all = session.struct('Context_Control', self._int_fields(types.lookup('Context_Control')))
+                self.pc_on_stack = pc is None
+                return
+
+        if types.lookup('ppc_context') is not None:
+            self.name = 'powerpc'
+            self.st = session.struct('ppc_context', {'sp': 'gpr1', 'pc': 'lr'})
+            self.all = session.struct('ppc_context', self._int_fields(types.lookup('ppc_context')))
+            self.pc_on_stack = False
+            # Context_Control.context[] is sized for the context plus one cache line of slack
+            clsz = types.sizeof('Context_Control') - types.sizeof('ppc_context')
+            self.clsz = clsz if clsz > 0 and clsz & (clsz - 1) == 0 else PPC_DEFAULT_CACHE_LINE_SIZE
+
+    @staticmethod
+    def _int_fields(t, prefix: str = '') -> dict[str, str]:
+        """Returns name -> dotted path of the integer and pointer fields of a struct, nested structs included"""
+        r = {}
+        for name, _, ft in t.fields():
+            path = f'{prefix}{name}' if name else prefix[:-1]
+            if ft.code in ('struct', 'union'):
+                r.update(ArchContext._int_fields(ft, f'{path}.' if path else ''))
+            elif name and Types._kind(ft) != 'raw':
+                r[path] = path
+        return r
+
+    def _decode(self, threads: list[int], st: Struct) -> dict[int, dict]:
+        """Decodes st from the saved context of each thread"""
+        result = {}
+        if self.name is None or self.regs_off is None:
+            return result
+
+        size = self.session.types.sizeof('Thread_Control')
+        blocks = self.session.mem.read_many(threads, size)
+        for t, data in blocks.items():
+            ctx = t + self.regs_off
+            if self.name == 'powerpc':
+                ctx = (ctx & ~(self.clsz - 1)) + self.clsz
+            off = ctx - t
+            if off + st.size > len(data):
+                data = self.session.mem.read(ctx, st.size)
+                off = 0
+            result[t] = st.decode(data, off)
+        return result
+
+    def contexts(self, threads: list[int]) -> dict[int, dict[str, int]]:
+        """
+        Returns the integer fields of the saved context of each thread, by field name.
+        Threads whose context can't be read are left out.
+
+        Parameters
+        ----------
+        threads : list[int]
+            Addresses of Thread_Control blocks. These are typically cached already.
+        """
+        return self._decode(threads, self.all)
+
+    def registers(self, threads: list[int]) -> dict[int, tuple[int | None, int | None]]:
+        """
+        Returns the saved (pc, sp) of each thread
+
+        Parameters
+        ----------
+        threads : list[int]
+            Addresses of Thread_Control blocks. These are typically cached already.
+        """
+        result = {x: (None, None) for x in threads}
+        for t, r in self._decode(threads, self.st).items():
+            result[t] = (r['pc'], r['sp'])
+
+        if self.pc_on_stack:
+            sps = [sp for pc, sp in result.values() if sp]
+            tops = self.session.mem.read_many(sps, self.session.types.ptr_size)
+            for t, (pc, sp) in result.items():
+                result[t] = (self.session.word(tops[sp]) if sp in tops else None, sp)
+        return result
+
+
+# Fill byte of unused stack (stack checker), and the size of the sanity pattern at the low end of each stack
+STACK_FILL_BYTE = b'\xa5'
+STACK_PATTERN_SIZE = 16
+STACK_PATTERN_WORDS = [0xFEEDF00D, 0x0BAD0D06, 0xDEADF00D, 0x600D0D06]
+
+def stack_usage(session: Session, stacks: list[tuple[int, int]]) -> dict[tuple[int, int], tuple[int, bool] | None]:
+    """
+    Computes the high-water mark of a list of stacks. Each stack is read in one piece and the end of
+    the fill pattern is found with bytes.lstrip.
+
+    Parameters
+    ----------
+    session : Session
+        Session to read with
+    stacks : list[tuple[int, int]]
+        (area, size) of each stack, as in Stack_Control
+
+    Returns
+    -------
+    dict[tuple[int, int], tuple[int, bool] | None] :
+        (bytes used, overflowed) for each stack. A stack that has no fill left is fully used, and has
+        overflowed if the sanity pattern is gone as well. None if the stack has neither the sanity
+        pattern nor any fill (stack checker disabled).
+    """
+    data = session.mem.read_ranges([x for x in stacks if x[0] and x[1]])
+    result = {}
+    for key in stacks:
+        area = data.get(key)
+        if area is None:
+            result[key] = None
+            continue
+        # Skip the sanity pattern at the low end, in either byte order
+        skip = 0
+        for order in ['big', 'little']:
+            if area[:STACK_PATTERN_SIZE] == b''.join([x.to_bytes(4, order) for x in STACK_PATTERN_WORDS]):
+                skip = STACK_PATTERN_SIZE
+        # Stacks grow down on all supported architectures, so the untouched fill is at the start
+        unused = len(area) - skip - len(area[skip:].lstrip(STACK_FILL_BYTE))
+        if unused > 0 or skip > 0:
+            result[key] = (len(area) - skip - unused, False)
+        elif STACK_FILL_BYTE in area:
+            # Filled, but both the sanity pattern and the fill at the low end have been overwritten
+            result[key] = (len(area), True)
+        else:
+            result[key] = None
+    return result
+
+
+def elf_sections(elf: bytes) -> list[tuple[str, int, int, int, int, int, int]]:
+    """
+    Parses the section headers of an ELF file
+
+    Parameters
+    ----------
+    elf : bytes
+        Contents of the file
+
+    Returns
+    -------
+    list[tuple[str, int, int, int, int, int, int]] :
+        (name, type, flags, offset, size, link, entsize) of each section, empty if this isn't an ELF file
+    """
+    if elf[:4] != b'\x7fELF':
+        return []
+    is64 = elf[4] == 2
+    e = '<' if elf[5] == 1 else '>'
+    if is64:
+        shoff, = struct.unpack_from(e + 'Q', elf, 0x28)
+        shentsize, shnum, shstrndx = struct.unpack_from(e + 'HHH', elf, 0x3A)
+        fmt = e + 'IIQQQQIIQQ'
+    else:
+        shoff, = struct.unpack_from(e + 'I', elf, 0x20)
+        shentsize, shnum, shstrndx = struct.unpack_from(e + 'HHH', elf, 0x2E)
+        fmt = e + 'IIIIIIIIII'
+
+    hdrs = [struct.unpack_from(fmt, elf, shoff + i * shentsize) for i in range(shnum)]
+    strtab = hdrs[shstrndx][4] if shstrndx < shnum else None
+    result = []
+    for name, typ, flags, _, off, size, link, _, _, entsize in hdrs:
+        if strtab is not None:
+            name = elf[strtab + name:elf.index(b'\0', strtab + name)].decode(errors='replace')
+        else:
+            name = ''
+        result.append((name, typ, flags, off, size, link, entsize))
+    return result
+
+
+class ElfSymbols:
+    """
+    Sorted index of the function symbols in an ELF file's .symtab, for fast address -> name lookups
+
+    Parameters
+    ----------
+    path : str
+        Path to the ELF file
+    """
+    STT_FUNC = 2
+    SHT_SYMTAB = 2
+    EM_ARM = 40
+    ET_REL = 1
+
+    def __init__(self, path: str):
+        self.path = path
+        self.addrs = []
+        self.ends = []
+        self.names = []
+
+        with open(path, 'rb') as fp:
+            elf = fp.read()
+        sections = elf_sections(elf)
+        if len(sections) == 0:
+            return
+        is64 = elf[4] == 2
+        e = '<' if elf[5] == 1 else '>'
+        etype, machine = struct.unpack_from(e + 'HH', elf, 16)
+        # Symbol values of relocatable objects (i.e. loaded by the RTL) are section offsets, not addresses
+        if etype == self.ET_REL:
+            return
+
+        syms = []
+        for _, typ, _, off, size, link, entsize in sections:
+            if typ != self.SHT_SYMTAB or entsize == 0:
+                continue
+            stroff = sections[link][3]
+            for j in range(size // entsize):
+                if is64:
+                    name, info, _, shndx, value, sz = struct.unpack_from(e + 'IBBHQQ', elf, off + j * entsize)
+                else:
+                    name, value, sz, info, _, shndx = struct.unpack_from(e + 'IIIBBH', elf, off + j * entsize)
+                if info & 0xF != self.STT_FUNC or shndx == 0:
+                    continue
+                # Thumb functions have the low bit set
+                if machine == self.EM_ARM:
+                    value &= ~1
+                end = elf.index(b'\0', stroff + name)
+                syms.append((value, sz, elf[stroff + name:end].decode(errors='replace')))
+
+        syms.sort()
+        self.addrs = [x[0] for x in syms]
+        self.ends = [x[0] + max(x[1], 1) for x in syms]
+        self.names = [x[2] for x in syms]
+
+    def lookup(self, addr: int) -> str | None:
+        """Returns the name of the function containing addr, or None"""
+        i = bisect.bisect_right(self.addrs, addr) - 1
+        if i < 0 or addr >= self.ends[i]:
+            return None
+        return self.names[i]
+
+# Fields of Thread_Control used by the commands
+THREAD_FIELDS = {
+    'id': 'Object.id',
+    'name': 'Object.name.name_u32',
+    'state': 'current_state',
+    'wait_flags': 'Wait.flags',
+    'stack_area': 'Start.Initial_stack.area',
+    'stack_size': 'Start.Initial_stack.size',
+}
+
+# CPU time accounting, Timestamp_Control is an sbintime_t (RTEMS 5+) or a struct timespec (4.x)
+CPU_TIME_FIELDS = {
+    'cpu_time': 'cpu_time_used',
+    'cpu_time_sec': 'cpu_time_used.tv_sec',
+    'cpu_time_nsec': 'cpu_time_used.tv_nsec',
+}
+
+def _cpu_time_ns(t: dict) -> int | None:
+    """Converts the CPU_TIME_FIELDS of a thread to nanoseconds"""
+    if t['cpu_time'] is not None:
+        # sbintime_t, 32.32 fixed point seconds
+        return (t['cpu_time'] * 1000000000) >> 32
+    if t['cpu_time_sec'] is not None:
+        return t['cpu_time_sec'] * 1000000000 + t['cpu_time_nsec']
+    return None
+
+# Object classes that own threads, the IDLE threads are in _Thread_Information
+THREAD_INFORMATION = ['_Thread_Information', '_RTEMS_tasks_Information', '_POSIX_Threads_Information']
+
+SEMAPHORE_FIELDS = {
+    'id': 'Object.id',
+    'name': 'Object.name.name_u32',
+    # The wait queue is at the same offset for all types in the union
+    'owner': 'Core_control.Semaphore.Wait_queue.Queue.owner',
+}
+# Additional fields recorded by rtems snapshot. Fields that don't exist in the RTEMS version
+# being debugged are recorded as null.
+SNAPSHOT_THREAD_FIELDS = {
+    **THREAD_FIELDS,
+    'priority': 'Real_priority.priority',
+    'wait_queue': 'Wait.queue',
+    'timer_expire': 'Timer.Watchdog.expire',
+    **CPU_TIME_FIELDS,
+}
+
+SNAPSHOT_SEMAPHORE_FIELDS = {
+    **SEMAPHORE_FIELDS,
+    'count': 'Core_control.Semaphore.count',
+    'waiters': 'Core_control.Semaphore.Wait_queue.Queue.heads',
+}
+
+MESSAGE_QUEUE_FIELDS = {
+    'id': 'Object.id',
+    'name': 'Object.name.name_u32',
+    'pending': 'message_queue.number_of_pending_messages',
+    'max_pending': 'message_queue.maximum_pending_messages',
+    'max_size': 'message_queue.maximum_message_size',
+    'waiters': 'message_queue.Wait_queue.Queue.heads',
+}
+
+TIMER_FIELDS = {
+    'id': 'Object.id',
+    'name': 'Object.name.name_u32',
+    'class': 'the_class',
+    'initial': 'initial',
+    'start_time': 'start_time',
+    'stop_time': 'stop_time',
+    'expire': 'Ticker.expire',
+}
+
+# Object classes with a wait queue: (key in the snapshot, information symbol, type, path of the Thread_queue_Queue)
+WAIT_QUEUE_OBJECTS = [
+    ('semaphores', '_Semaphore_Information', 'Semaphore_Control', 'Core_control.Semaphore.Wait_queue.Queue'),
+    ('message_queues', '_Message_queue_Information', 'Message_queue_Control', 'message_queue.Wait_queue.Queue'),
+]
+
+def snapshot(session: Session) -> dict:
+    """
+    Captures the state of the system in one pass: tasks (with registers and stack usage),
+    semaphores, message queues, timers and the wait queues threads are blocked on
+
+    Parameters
+    ----------
+    session : Session
+        Session to read with
+
+    Returns
+    -------
+    dict :
+        JSON serializable snapshot. Addresses are integers, names are decoded.
+    """
+    def objects(info: str, type_name: str, fields: dict[str, str]) -> list[dict]:
+        if session.types.lookup(type_name) is None:
+            return []
+        r = []
+        for a, o in session.read_objects(info, type_name, fields):
+            o['name'] = _decode_name(o['name'] or 0)
+            r.append({'address': a, **o})
+        return r
+
+    threads = []
+    for info in THREAD_INFORMATION:
+        threads += objects(info, 'Thread_Control', SNAPSHOT_THREAD_FIELDS)
+    stacks = stack_usage(session, [(t['stack_area'] or 0, t['stack_size'] or 0) for t in threads])
+    regs = session.arch.registers([t['address'] for t in threads])
+    contexts = session.arch.contexts([t['address'] for t in threads])
+    for t in threads:
+        t['state_name'] = _thr_state_name(t['state'])
+        t['wait_class'] = _wait_class_flags(t['wait_flags'] or 0)
+        usage = stacks[(t['stack_area'] or 0, t['stack_size'] or 0)]
+        t['stack_used'], t['stack_overflow'] = (None, None) if usage is None else usage
+        t['pc'], t['sp'] = regs[t['address']]
+        t['registers'] = contexts.get(t['address'], {})
+        t['cpu_time_ns'] = _cpu_time_ns(t)
+        for k in CPU_TIME_FIELDS:
+            del t[k]
+
+    result = {
+        'arch': session.arch.name,
+        'little_endian': session.types.little_endian,
+        'ptr_size': session.types.ptr_size,
+        'tasks': threads,
+        'semaphores': objects('_Semaphore_Information', 'Semaphore_Control', SNAPSHOT_SEMAPHORE_FIELDS),
+        'message_queues': objects('_Message_queue_Information', 'Message_queue_Control', MESSAGE_QUEUE_FIELDS),
+        'timers': objects('_Timer_Information', 'Timer_Control', TIMER_FIELDS),
+    }
+
+    # Wait queues, keyed by the address of the Thread_queue_Queue threads point to with Wait.queue
+    queues = {}
+    for key, _, type_name, path in WAIT_QUEUE_OBJECTS:
+        f = session.types.field(type_name, path)
+        if f is None:
+            continue
+        for o in result[key]:
+            queues[o['address'] + f[0]] = {'object': o['id'], 'object_type': key, 'owner': None, 'waiters': []}
+    owner = session.types.field('Thread_queue_Queue', 'owner')
+    for t in threads:
+        q = t['wait_queue']
+        if q:
+            queues.setdefault(q, {'object': None, 'object_type': None, 'owner': None, 'waiters': []})
+            queues[q]['waiters'].append(t['id'])
+    if owner is not None:
+        data = session.mem.read_many(list(queues.keys()), owner[0] + owner[1])
+        for q, d in data.items():
+            queues[q]['owner'] = session.word(d, owner[0]) or None
+    by_address = {t['address']: t['id'] for t in threads}
+    result['wait_queues'] = [
+        {'address': q, **v, 'owner_id': by_address.get(v['owner'])}
+        for q, v in sorted(queues.items()) if len(v['waiters']) > 0 or v['owner']
+    ]
+    return result
+
+
+def print_tasks(session: Session):
+    """
+    Prints the state, saved registers and stack usage of all Classic API tasks
+    """
+    tasks = session.read_objects('_RTEMS_tasks_Information', 'Thread_Control', THREAD_FIELDS)
+    # Stacks first, so the return addresses of pc-on-stack architectures come from the cache
+    stacks = stack_usage(session, [(t['stack_area'] or 0, t['stack_size'] or 0) for _, t in tasks])
+    regs = session.arch.registers([a for a, _ in tasks])
+
+    for a, t in tasks:
+        pc, sp = regs[a]
+        usage = stacks[(t['stack_area'] or 0, t['stack_size'] or 0)]
+        print(f'{_decode_name(t["name"])} -->')
+        print(f'  State: {_thr_state_name(t["state"])}')
+        print(f'  Wait State:')
+        print(f'    Class: {", ".join(_wait_class_flags(t["wait_flags"] or 0))}')
+        print(f'  PC: {"?" if pc is None else hex(pc)}')
+        print(f'  SP: {"?" if sp is None else hex(sp)}')
+        if usage is None:
+            print(f'  Stack: ? / {t["stack_size"]} (no fill pattern)')
+        elif usage[1]:
+            print(f'  Stack: OVERFLOW / {t["stack_size"]} (sanity pattern overwritten)')
+        else:
+            used = usage[0]
+            print(f'  Stack: {used} / {t["stack_size"]} ({100.0 * used / t["stack_size"]:.1f}%)')
+
+
+def print_semaphores(session: Session, locked_only: bool = False):
+    """
+    Prints all Classic API semaphores and their owners
+
+    Parameters
+    ----------
+    session : Session
+        Session to read with
+    locked_only : bool
+        Only print semaphores that are currently owned
+    """
+    sems = session.read_objects('_Semaphore_Information', 'Semaphore_Control', SEMAPHORE_FIELDS)
+
+    # Owners are thread control blocks, read their names in one go
+    owners = [s['owner'] for _, s in sems if s['owner']]
+    th = session.struct('Thread_Control', THREAD_FIELDS)
+    blocks = session.mem.read_many(owners, th.size)
+
+    for _, s in sems:
+        is_locked = bool(s['owner'])
+        if locked_only and not is_locked:
+            continue
+        name = _decode_name(s['name'])
+        print(f'{name if len(name) else "<unnamed>"} -->')
+        print(f'  Status: {"Locked" if is_locked else "Unlocked"}')
+        if is_locked:
+            owner = _decode_name(th.decode(blocks[s['owner']])['name']) if s['owner'] in blocks else '?'
+            print(f'    Owner: {hex(s["owner"])} ({owner})')
+
+
+# Heaps to inspect: (description, symbol, whether the symbol is a pointer to the Heap_Control)
+HEAPS = [
+    ('C program heap', 'RTEMS_Malloc_Heap', True),
+    ('Workspace', '_Workspace_Area', False),
+]
+
+HEAP_CONTROL_FIELDS = {
+    'page_size': 'page_size',
+    'area_begin': 'area_begin',
+    'area_end': 'area_end',
+    'first_block': 'first_block',
+    'last_block': 'last_block',
+}
+
+# Set in Heap_Block.size_and_flag if the previous block is used
+HEAP_PREV_BLOCK_USED = 1
+
+# Amount of heap read at once while walking. Only the chunks containing block headers are read,
+# so large free blocks are skipped over.
+HEAP_CHUNK = READ_MAX
+
+def heap_walk(session: Session, heap: int) -> dict:
+    """
+    Walks the block list of a heap on the host, reading it in HEAP_CHUNK pieces
+
+    Parameters
+    ----------
+    session : Session
+        Session to read with
+    heap : int
+        Address of the Heap_Control
+
+    Returns
+    -------
+    dict :
+        area_begin, area_end, used and free (lists of block sizes) and error (None, or why the walk
+        stopped early, i.e. a corrupted block)
+    """
+    hc = session.struct('Heap_Control', HEAP_CONTROL_FIELDS)
+    hdr = hc.decode(session.mem.read(heap, hc.size))
+    hb = session.struct('Heap_Block', {'size_and_flag': 'size_and_flag'})
+    off, fmt = hb.fields['size_and_flag']
+    width = struct.calcsize(fmt)
+
+    result = {'area_begin': hdr['area_begin'], 'area_end': hdr['area_end'], 'used': [], 'free': [], 'error': None}
+    first, last = hdr['first_block'], hdr['last_block']
+    if not first or not last:
+        result['error'] = 'heap is not initialized'
+        return result
+
+    start, chunk = 0, b''
+    block, prev_size = first, None
+    while True:
+        if not (start <= block + off and block + off + width <= start + len(chunk)):
+            start = block
+            try:
+                chunk = session.mem.read(block, max(off + width, min(HEAP_CHUNK, last + off + width - block)))
+            except Exception as e:
+                result['error'] = f'cannot read block at {hex(block)}: {e}'
+                break
+        value = struct.unpack_from(fmt, chunk, block + off - start)[0]
+        # The used flag of a block is kept in the block that follows it
+        if prev_size is not None:
+            result['used' if value & HEAP_PREV_BLOCK_USED else 'free'].append(prev_size)
+        if block == last:
+            break
+        size = value & ~HEAP_PREV_BLOCK_USED
+        if size == 0 or block + size > last:
+            result['error'] = f'corrupted block at {hex(block)} (size {size})'
+            break
+        block, prev_size = block + size, size
+    return result
+
+
+def print_heaps(session: Session, top: int = 10):
+    """
+    Prints usage and fragmentation of the C program heap and the workspace
+
+    Parameters
+    ----------
+    session : Session
+        Session to read with
+    top : int
+        Number of most common allocation sizes to show
+    """
+    seen = set()
+    for desc, sym, is_ptr in HEAPS:
+        addr = session.symbol(sym)
+        if addr is not None and is_ptr:
+            addr = session.read_ptrs(addr, 1)[0]
+        # With the unified workspace, malloc() uses the workspace
+        if not addr or addr in seen:
+            continue
+        seen.add(addr)
+
+        h = heap_walk(session, addr)
+        used, free = h['used'], h['free']
+        total_free = sum(free)
+        largest = max(free, default=0)
+        print(f'{desc} ({sym} @ {hex(addr)}): {hex(h["area_begin"])} - {hex(h["area_end"])}, {len(used) + len(free)} blocks')
+        if h['error'] is not None:
+            print(f'  Walk stopped early: {h["error"]}')
+        print(f'  Used: {sum(used)} bytes in {len(used)} blocks')
+        print(f'  Free: {total_free} bytes in {len(free)} blocks, largest {largest}')
+        if total_free > 0:
+            print(f'  Fragmentation: {100.0 * (1 - largest / total_free):.1f}% (free memory outside the largest free block)')
+
+        if len(free) > 0:
+            # Free block sizes by power of two
+            buckets = {}
+            for s in free:
+                b = max(s - 1, 1).bit_length()
+                n, t = buckets.get(b, (0, 0))
+                buckets[b] = (n + 1, t + s)
+            print('  Free blocks by size:')
+            for b in sorted(buckets):
+                n, t = buckets[b]
+                print(f'    <= {1 << b:>10}: {n:8} blocks {t:12} bytes')
+
+        if len(used) > 0:
+            sizes = {}
+            for s in used:
+                sizes[s] = sizes.get(s, 0) + 1
+            print('  Most common allocation (block) sizes:')
+            for s, n in sorted(sizes.items(), key=lambda x: (-x[1], -x[0]))[:top]:
+                print(f'    {s:>10} x {n:<8} {s * n:12} bytes')
+
+
+RTL_OBJ_FIELDS = {
+    'oname': 'oname',
+    'aname': 'aname',
+    'text_base': 'text_base',
+}
+
+RTL_SECT_FIELDS = {
+    'name': 'name',
+    'base': 'base',
+    'size': 'size',
+}
+
+def rtl_objects(session: Session) -> list[dict]:
+    """
+    Reads the objects loaded by the runtime loader (libdl) and their sections
+
+    Parameters
+    ----------
+    session : Session
+        Session to read with
+
+    Returns
+    -------
+    list[dict] :
+        address, name (object name), archive (archive name, or ''), text_base and sections
+        (list of dicts with name, base and size) of each object. The base image is left out.
+    """
+    rtl = session.symbol('rtl')
+    objects = session.types.field('rtems_rtl_data', 'objects')
+    if rtl is None or objects is None:
+        return []
+    rtl = session.read_ptrs(rtl, 1)[0]
+    if rtl == 0:
+        return []
+    base = session.types.field('rtems_rtl_data', 'base')
+    base = session.word(session.mem.read(rtl + base[0], base[1])) if base is not None else None
+
+    sections = session.types.field('rtems_rtl_obj', 'sections')
+    objs = []
+    for a, o in session.read_chain(rtl + objects[0], 'rtems_rtl_obj', 'link', RTL_OBJ_FIELDS):
+        if a == base:
+            continue
+        secs = session.read_chain(a + sections[0], 'rtems_rtl_obj_sect', 'node', RTL_SECT_FIELDS)
+        objs.append({'address': a, **o, 'sections': [s for _, s in secs]})
+
+    names = session.read_strings([o['oname'] for o in objs] + [o['aname'] for o in objs] +
+                                 [s['name'] for o in objs for s in o['sections']])
+    for o in objs:
+        o['name'], o['archive'] = names[o.pop('oname')], names[o.pop('aname')]
+        for s in o['sections']:
+            s['name'] = names[s['name']]
+    return objs
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------
+# Company    : SLAC National Accelerator Laboratory
+# ----------------------------------------------------------------------------
+# Description : Generates legacy U-Boot images (uImage) from a flat binary.
+# Replacement for 'gzip -9 && mkimage' that doesn't require u-boot-tools on
+# the build host. gzip compression is split into chunks that are deflated on
+# multiple threads and concatenated into a single gzip stream.
+# ----------------------------------------------------------------------------
+# This file is part of the rtems-tools package. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the rtems-tools package, including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+# ----------------------------------------------------------------------------
+import os
+import argparse
+import struct
+import zlib
+import lzma
+from concurrent.futures import ThreadPoolExecutor
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-A', type=str, required=True, help='Architecture, i.e. arm, arm64/aarch64, powerpc')
+parser.add_argument('-O', type=str, default='rtems', help='Operating system, defaults to rtems')
+parser.add_argument('-T', type=str, default='kernel', help='Image type, defaults to kernel')
+parser.add_argument('-C', type=str, default='gzip', choices=['none', 'gzip', 'lzma'], help='Compression, defaults to gzip')
+parser.add_argument('-a', type=str, required=True, help='Load address')
+parser.add_argument('-e', type=str, default=None, help='Entry point, defaults to the load address')
+parser.add_argument('-n', type=str, default='RTEMS', help='Image name')
+parser.add_argument('-j', type=int, default=os.cpu_count(), help='Number of threads to compress with')
+parser.add_argument('-d', type=str, required=True, help='Input (flat binary) file')
+parser.add_argument('output', type=str, help='Output file')
+
+IH_MAGIC = 0x27051956
+IH_NMLEN = 32
+HEADER_FMT = '>IIIIIIIBBBB32s'
+
+IH_OS = {
+    'linux': 5,
+    'rtems': 18,
+}
+
+IH_ARCH = {
+    'arm': 2,
+    'i386': 3,
+    'mips': 5,
+    'powerpc': 7,
+    'ppc': 7,
+    'sh': 9,
+    'sparc': 10,
+    'sparc64': 11,
+    'm68k': 12,
+    'microblaze': 14,
+    'nios2': 15,
+    'x86_64': 24,
+    'arm64': 22,
+    'aarch64': 22,
+    'riscv': 26,
+}
+
+IH_TYPE = {
+    'standalone': 1,
+    'kernel': 2,
+    'ramdisk': 3,
+    'multi': 4,
+    'firmware': 5,
+    'script': 6,
+}
+
+IH_COMP = {
+    'none': 0,
+    'gzip': 1,
+    'lzma': 3,
+}
+
+# Size of the chunks deflated in parallel. Each chunk is primed with the 32K that precede it,
+# so the ratio is close to a single-threaded deflate.
+CHUNK_SIZE = 1024 * 1024
+WINDOW_SIZE = 32 * 1024
+
+def _deflate_chunk(data: memoryview, start: int, end: int, level: int) -> bytes:
+    """
+    Raw-deflates data[start:end]. All chunks but the last end with a sync flush (byte aligned,
+    not final) so the results can simply be concatenated.
+    """
+    if start > 0:
+        c = zlib.compressobj(level, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, bytes(data[max(0, start - WINDOW_SIZE):start]))
+    else:
+        c = zlib.compressobj(level, zlib.DEFLATED, -15, 9)
+    out = c.compress(data[start:end])
+    out += c.flush(zlib.Z_FINISH if end == len(data) else zlib.Z_SYNC_FLUSH)
+    return out
+
+def gzip_compress(data: bytes, level: int = 9, jobs: int | None = None) -> bytes:
+    """
+    Compresses data into a single gzip member, deflating CHUNK_SIZE chunks on multiple threads
+
+    Parameters
+    ----------
+    data : bytes
+        Data to compress
+    level : int
+        Compression level
+    jobs : int | None
+        Number of threads, defaults to the number of CPUs
+
+    Returns
+    -------
+    bytes :
+        The gzip stream. The header has no name and a zero mtime, so the output is reproducible.
+    """
+    view = memoryview(data)
+    bounds = [(x, min(x + CHUNK_SIZE, len(data))) for x in range(0, max(len(data), 1), CHUNK_SIZE)]
+    # zlib releases the GIL while compressing, so threads scale
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        chunks = list(pool.map(lambda b: _deflate_chunk(view, b[0], b[1], level), bounds))
+
+    header = struct.pack('<BBBBIBB', 0x1f, 0x8b, 8, 0, 0, 2 if level == 9 else 0, 3)
+    trailer = struct.pack('<II', zlib.crc32(data), len(data) & 0xffffffff)
+    return header + b''.join(chunks) + trailer
+
+def lzma_compress(data: bytes) -> bytes:
+    """
+    Compresses data in the .lzma (LZMA-alone) format U-Boot expects. This format can't be split,
+    so it's single threaded.
+    """
+    return lzma.compress(data, format=lzma.FORMAT_ALONE, filters=[{'id': lzma.FILTER_LZMA1, 'preset': 9}])
+
+def _lookup(table: dict, name: str, what: str) -> int:
+    try:
+        return table[name.lower()]
+    except KeyError:
+        raise ValueError(f'Unsupported {what} "{name}", must be one of: {", ".join(table.keys())}')
+
+def make_header(data: bytes, arch: str, load: int, entry: int, name: str = 'RTEMS', os_name: str = 'rtems',
+                type: str = 'kernel', comp: str = 'gzip', timestamp: int = 0) -> bytes:
+    """
+    Builds a legacy uImage header for the (already compressed) payload
+
+    Parameters
+    ----------
+    data : bytes
+        Image payload
+    arch : str
+        Architecture name, see IH_ARCH
+    load : int
+        Load address
+    entry : int
+        Entry point
+    name : str
+        Image name, truncated to 31 characters
+    os_name : str
+        Operating system, see IH_OS
+    type : str
+        Image type, see IH_TYPE
+    comp : str
+        Compression of the payload, see IH_COMP
+    timestamp : int
+        Creation time stored in the header
+
+    Returns
+    -------
+    bytes :
+        The 64 byte header
+    """
+    fields = [
+        IH_MAGIC, 0, timestamp & 0xffffffff, len(data), load, entry, zlib.crc32(data),
+        _lookup(IH_OS, os_name, 'OS'), _lookup(IH_ARCH, arch, 'architecture'),
+        _lookup(IH_TYPE, type, 'image type'), _lookup(IH_COMP, comp, 'compression'),
+        name.encode()[:IH_NMLEN - 1],
+    ]
+    fields[1] = zlib.crc32(struct.pack(HEADER_FMT, *fields))
+    return struct.pack(HEADER_FMT, *fields)
+
+def generate_uimage(input: str, output: str, arch: str, load: int, entry: int | None = None, name: str = 'RTEMS',
+                    comp: str = 'gzip', os_name: str = 'rtems', type: str = 'kernel', jobs: int | None = None):
+    """
+    Generates a uImage from a flat binary. The output is only rewritten if its contents change.
+
+    Parameters
+    ----------
+    input : str
+        Flat binary (i.e. objcopy -O binary output)
+    output : str
+        Image to generate
+    arch : str
+        Architecture name, see IH_ARCH
+    load : int
+        Load address
+    entry : int | None
+        Entry point, defaults to the load address
+    name : str
+        Image name
+    comp : str
+        Compression, one of none, gzip or lzma
+    os_name : str
+        Operating system, see IH_OS
+    type : str
+        Image type, see IH_TYPE
+    jobs : int | None
+        Number of compression threads (gzip only)
+    """
+    with open(input, 'rb') as fp:
+        data = fp.read()
+
+    if comp == 'gzip':
+        data = gzip_compress(data, 9, jobs)
+    elif comp == 'lzma':
+        data = lzma_compress(data)
+
+    # Stamp with SOURCE_DATE_EPOCH, or 0, instead of the current time so an unchanged payload always
+    # produces an identical image
+    timestamp = int(os.environ.get('SOURCE_DATE_EPOCH', 0))
+    image = make_header(data, arch, load, load if entry is None else entry, name, os_name, type, comp, timestamp) + data
+
+    try:
+        with open(output, 'rb') as fp:
+            if fp.read() == image:
+                return
+    except OSError:
+        pass
+    with open(f'{output}.tmp', 'wb') as fp:
+        fp.write(image)
+    os.replace(f'{output}.tmp', output)
+
+def main():
+    args = parser.parse_args()
+    try:
+        generate_uimage(
+            args.d, args.output, args.A, int(args.a, 0), None if args.e is None else int(args.e, 0),
+            args.n, args.C, args.O, args.T, args.j
+        )
+    except (ValueError, OSError) as e:
+        print(e)
+        exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -17,6 +17,11 @@ import os
 import sys
 import string
 import tarfile
+import hashlib
+import json
+import filecmp
+import re
+from concurrent.futures import ThreadPoolExecutor
 
 import bin2as
 
@@ -26,6 +31,15 @@ parser.add_argument('-o', type=str, required=True, help='Resulting C source file
 parser.add_argument('-t', action='store_true', help='Generate a tarball rootfs')
 parser.add_argument('-m', action='append', help='Define macro for substitution')
 parser.add_argument('-n', type=str, help='For embedded tarfs, generate an array with this name')
+parser.add_argument('-d', type=str, help='Write a Makefile-style depfile listing every embedded file')
+parser.add_argument('-f', action='store_true', help='Force regeneration, even if the inputs are unchanged')
+parser.add_argument('-j', type=int, default=None, help='Number of threads used to scan and hash the rootfs')
+
+# Bump this whenever the layout of the generated tarball changes, so stale manifests are ignored
+MANIFEST_VERSION = 1
+
+# Bump this whenever the layout of the scan/hash cache changes
+CACHE_VERSION = 1
 
 class RootfsFile:
     def __init__(self, name: str, dest: str, bits: str, uid: str, gid: str):
@@ -82,10 +96,194 @@ def _escape_quotes(l: str) -> str:
     """
     return l.replace("\\", "\\\\").replace("\"", "\\\"").rstrip()
 
+class _RootfsCache:
+    """
+    Cache of directory scans and file hashes, stored as JSON next to the generated output.
+
+    Scans are keyed by the rootfs.txt entry and are valid as long as none of the scanned
+    directories changed mtime (which happens whenever a file is added, removed or renamed).
+    Hashes are keyed by path and valid as long as the file's size and mtime are unchanged.
+    """
+    def __init__(self, file: str | None):
+        self.file = file
+        self.scans = {}
+        self.hashes = {}
+        if file is None:
+            return
+        try:
+            with open(file, 'r') as fp:
+                c = json.load(fp)
+            if c.get('version') == CACHE_VERSION:
+                self.scans = c['scans']
+                self.hashes = c['hashes']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def save(self):
+        if self.file is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.file)), exist_ok=True)
+        with open(f'{self.file}.tmp', 'w') as fp:
+            json.dump({'version': CACHE_VERSION, 'scans': self.scans, 'hashes': self.hashes}, fp)
+        os.replace(f'{self.file}.tmp', self.file)
+
+
+def _is_glob(name: str) -> bool:
+    return any(c in name for c in '*?[')
+
+def _glob_to_regex(pattern: str) -> re.Pattern:
+    """
+    Converts a glob pattern (relative to its base directory) into a regex.
+    '*', '?' and '[...]' never match '/', '**' matches any number of directories.
+    Unlike glob.glob, files starting with a '.' are matched too.
+    """
+    out = ''
+    parts = pattern.split('/')
+    for i, p in enumerate(parts):
+        last = i == len(parts) - 1
+        if p == '**':
+            out += '.*' if last else '(?:.*/)?'
+            continue
+        j = 0
+        while j < len(p):
+            c = p[j]
+            k = p.find(']', j + 1) if c == '[' else -1
+            if c == '*':
+                out += '[^/]*'
+            elif c == '?':
+                out += '[^/]'
+            elif k > 0:
+                body = p[j+1:k].replace('\\', '\\\\')
+                # Classes never match '/', like * and ?
+                out += f'[^/{body[1:]}]' if body.startswith('!') else f'(?!/)[{body}]'
+                j = k
+            else:
+                out += re.escape(c)
+            j += 1
+        if not last:
+            out += '/'
+    return re.compile(out + r'\Z')
+
+def _scan_dir(path: str) -> tuple[list[str], list[str], int]:
+    """
+    Lists a single directory, returning (files, subdirs, mtime).
+    Symlinked directories are not followed (like os.walk), they may point back up the tree.
+    """
+    files = []
+    subdirs = []
+    with os.scandir(path) as it:
+        for e in it:
+            if e.is_dir(follow_symlinks=False):
+                subdirs.append(e.path)
+            elif e.is_file():
+                files.append(e.path)
+    return (files, subdirs, os.stat(path).st_mtime_ns)
+
+def _dir_mtime(path: str) -> int | None:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def _scan_tree(base: str, pool: ThreadPoolExecutor) -> tuple[list[str], dict[str, int]]:
+    """
+    Recursively lists base, one directory level at a time, scanning the directories of each level in parallel.
+
+    Returns
+    -------
+    tuple[list[str], dict[str, int]]
+        (sorted list of files, mapping of scanned directory -> mtime)
+    """
+    files = []
+    dirs = {}
+    pending = [base]
+    while len(pending) > 0:
+        results = list(pool.map(_scan_dir, pending))
+        next = []
+        for path, (f, sd, mtime) in zip(pending, results):
+            files += f
+            dirs[path] = mtime
+            next += sd
+        pending = next
+    return (sorted(files), dirs)
+
+def _expand_entry(dir: str, entry: RootfsFile, cache: _RootfsCache, pool: ThreadPoolExecutor) -> tuple[list[RootfsFile], list[str]]:
+    """
+    Expands a directory or glob entry from rootfs.txt into the files it refers to.
+    Each file inherits the entry's permissions and ownership. The destination of each
+    file is the entry's destination, plus the file's path relative to the directory
+    (or the non-wildcard part of the glob).
+
+    Returns
+    -------
+    tuple[list[RootfsFile], list[str]]
+        (expanded files, list of directories that were scanned)
+    """
+    path = entry.get_abs_path(dir)
+    is_glob = _is_glob(entry.name)
+    if not is_glob and not os.path.isdir(path):
+        return ([entry], [])
+
+    # Split the entry into the directory to scan and the pattern within it
+    if is_glob:
+        parts = entry.name.split('/')
+        n = [i for i, x in enumerate(parts) if _is_glob(x)][0]
+        name_base = '/'.join(parts[:n])
+        pattern = _glob_to_regex('/'.join(parts[n:]))
+    else:
+        name_base = entry.name.rstrip('/')
+        pattern = None
+    if len(name_base) == 0 and entry.name.startswith('/'):
+        name_base = '/'
+    scan_base = RootfsFile(name_base, '/', '', '', '').get_abs_path(dir) if len(name_base) > 0 else dir
+
+    # Reuse the previous scan if none of the directories changed
+    key = os.path.abspath(scan_base)
+    cached = cache.scans.get(key)
+    if cached is not None and all(m == cached['dirs'][d] for d, m in zip(cached['dirs'], pool.map(_dir_mtime, cached['dirs']))):
+        found, dirs = cached['files'], cached['dirs']
+    else:
+        found, dirs = _scan_tree(key, pool)
+        found = [os.path.relpath(x, key) for x in found]
+        cache.scans[key] = {'dirs': dirs, 'files': found}
+
+    files = []
+    for rel in found:
+        if pattern is not None and pattern.match(rel) is None:
+            continue
+        files.append(RootfsFile(
+            os.path.join(name_base, rel) if len(name_base) > 0 else rel,
+            '/' if entry.dest == '/' else f'{entry.dest.rstrip("/")}/{rel}',
+            entry.bits, entry.uid, entry.gid
+        ))
+    return (files, list(dirs))
+
+def _load_config(dir: str, macros: dict, cache: _RootfsCache, pool: ThreadPoolExecutor) -> tuple[list[RootfsFile], list[str]]:
+    """
+    Parses the rootfs configuration file and expands all directory and glob entries
+
+    Returns
+    -------
+    tuple[list[RootfsFile], list[str]]
+        (list of files, list of directories scanned to produce it)
+    """
+    files = []
+    dirs = []
+    # Entries are expanded one at a time, the pool is used to scan within each entry
+    for entry in _parse_config(dir, macros):
+        f, d = _expand_entry(dir, entry, cache, pool)
+        files += f
+        dirs += d
+    return (files, dirs)
+
 def _parse_config(dir: str, macros: dict) -> list[RootfsFile]:
     """
     Parse the rootfs configuration file
 
+    Each entry is either a single file, a directory (which is included recursively) or a glob pattern
+    ('*', '?', '[...]' and '**' are supported). Directory and glob entries apply their permissions and
+    ownership to every file they match. Entries are not expanded here, see _load_config.
+
     Parameters
     ----------
     dir : str
@@ -119,7 +317,67 @@ def _parse_config(dir: str, macros: dict) -> list[RootfsFile]:
                                     m[4].rstrip() if len(m) > 4 else '0'))
     return files
 
-def generate_source(dir: str, out: str, macros: dict):
+def resolve_files(dir: str, macros: dict, cache: str | None = None, dirs: bool = False, jobs: int | None = None) -> list[str]:
+    """
+    Returns the list of files that will be embedded into the rootfs, after macro substitution.
+    The list always begins with the rootfs.txt itself, so it may be used directly as a dependency list.
+
+    Parameters
+    ----------
+    dir : str
+        Rootfs directory
+    macros : dict
+        Macros for string substitution
+    cache : str | None
+        Path to the scan cache, usually {out}.cache
+    dirs : bool
+        Also list the directories that were scanned for directory and glob entries. Their mtimes change
+        whenever files are added or removed, which is useful in depfiles.
+    jobs : int | None
+        Number of threads to scan with, defaults to the number of CPUs
+
+    Returns
+    -------
+    list[str]
+        Absolute paths to rootfs.txt and each file it references
+    """
+    c = _RootfsCache(cache)
+    with ThreadPoolExecutor(jobs) as pool:
+        files, scanned = _load_config(dir, macros, c, pool)
+    c.save()
+
+    result = [os.path.abspath(f'{dir}/rootfs.txt')]
+    result += [os.path.abspath(f.get_abs_path(dir)) for f in files]
+    if dirs:
+        result += scanned
+    return list(dict.fromkeys(result))
+
+def _escape_dep(path: str) -> str:
+    """
+    Escapes a path for use in a Makefile-style depfile
+    """
+    return path.replace(' ', '\\ ').replace('#', '\\#').replace('$', '$$')
+
+def write_depfile(file: str, target: str, deps: list[str]):
+    """
+    Writes a Makefile-style depfile, as understood by CMake's DEPFILE option and Ninja
+
+    Parameters
+    ----------
+    file : str
+        Path to the depfile
+    target : str
+        Target that depends on deps (i.e. the generated rootfs.S)
+    deps : list[str]
+        List of dependencies, as returned by resolve_files
+    """
+    with open(file, 'w') as fp:
+        fp.write(f'{_escape_dep(target)}:')
+        for d in deps:
+            fp.write(f' \\\n  {_escape_dep(d)}')
+        fp.write('\n')
+
+def generate_source(dir: str, out: str, macros: dict, jobs: int | None = None):
     """
     Generate a rootfs.c file, instead of using the tarball method
 
@@ -131,15 +389,20 @@ def generate_source(dir: str, out: str, macros: dict):
         Output file
     macros : dict
         Macros for string substitution
+    jobs : int | None
+        Number of threads to scan with, defaults to the number of CPUs
     """
-    files = _parse_config(dir, macros)    
+    cache = _RootfsCache(f'{out}.cache')
+    with ThreadPoolExecutor(jobs) as pool:
+        files, _ = _load_config(dir, macros, cache, pool)
+    cache.save()
     with open(out, 'w') as fp:
         fp.write(f'// WARNING: This was generated using "{" ".join(sys.argv)}"\n// DO NOT MODIFY!\n\n')
         fp.write('#include <rtems.h>\n#include <rtems/shell.h>\n#include <unistd.h>\n#include <stdio.h>\n\n')
         # File contents
         for f in files:
             fp.write(f'const char* {_clean_fn(f.name)} = \n')
-            with open(f'{dir}/{f.name}', 'r') as ip:
+            with open(f.get_abs_path(dir), 'r') as ip:
                 lines=ip.readlines()
                 for l in lines:
                     fp.write(f'  \"{_escape_quotes(l)}\\n\"\n')
@@ -155,10 +418,101 @@ def generate_source(dir: str, out: str, macros: dict):
         fp.write('}\n')
 
 
-def generate_tarball(dir: str, out: str, macros: dict):
+def _hash_file(file: str) -> str:
+    """
+    Returns the sha256 digest of a file's contents
+    """
+    h = hashlib.sha256()
+    with open(file, 'rb') as fp:
+        b = fp.read(1 << 20)
+        while len(b) > 0:
+            h.update(b)
+            b = fp.read(1 << 20)
+    return h.hexdigest()
+
+def _hash_files(files: list[str], cache: _RootfsCache, pool: ThreadPoolExecutor) -> list[str]:
+    """
+    Hashes a list of files in parallel. Files whose size and mtime match the cache are not re-read.
+    """
+    def hash_one(file: str) -> str:
+        st = os.stat(file)
+        c = cache.hashes.get(file)
+        if c is not None and c[0] == st.st_size and c[1] == st.st_mtime_ns:
+            return c[2]
+        h = _hash_file(file)
+        cache.hashes[file] = [st.st_size, st.st_mtime_ns, h]
+        return h
+    return list(pool.map(hash_one, files))
+
+def _make_manifest(dir: str, files: list[RootfsFile], macros: dict, cache: _RootfsCache, pool: ThreadPoolExecutor) -> dict:
+    """
+    Builds the content manifest for a tarball rootfs. Covers everything that ends up in the tarball:
+    file contents, destination, permissions and ownership, plus the macros used to resolve rootfs.txt
+
+    Parameters
+    ----------
+    dir : str
+        Rootfs directory
+    files : list[RootfsFile]
+        Parsed rootfs config
+    macros : dict
+        Macros for string substitution
+    cache : _RootfsCache
+        Cache of previously computed hashes
+    pool : ThreadPoolExecutor
+        Pool to hash the files with
+    """
+    paths = [os.path.abspath(f.get_abs_path(dir)) for f in files]
+    hashes = _hash_files(paths, cache, pool)
+    return {
+        'version': MANIFEST_VERSION,
+        'macros': {k: str(v) for k, v in sorted(macros.items())},
+        'files': [
+            {
+                'src': p,
+                'dest': f.get_arch_name(),
+                'bits': f.bits,
+                'uid': f.uid,
+                'gid': f.gid,
+                'sha256': h,
+            } for f, p, h in zip(files, paths, hashes)
+        ]
+    }
+
+def _load_manifest(file: str) -> dict | None:
+    """
+    Loads a previously written manifest, returns None if it's missing or unreadable
+    """
+    try:
+        with open(file, 'r') as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+def _replace_if_changed(tmp: str, file: str) -> bool:
+    """
+    Moves tmp over file, unless both have identical contents. In that case tmp is discarded
+    and file (along with its mtime) is left alone.
+
+    Returns
+    -------
+    bool
+        True if file was replaced
+    """
+    if os.path.exists(file) and filecmp.cmp(tmp, file, shallow=False):
+        os.remove(tmp)
+        return False
+    os.replace(tmp, file)
+    return True
+
+def generate_tarball(dir: str, out: str, macros: dict, force: bool = False, jobs: int | None = None):
     """
     Generate a rootfs.c that encodes a tar file to be used with rtems tarfs
 
+    A manifest of the inputs is stored in {out}.manifest. When it matches the current inputs,
+    generation is skipped entirely. Outputs that are regenerated with identical contents are not
+    rewritten, so their mtimes don't trigger a reassemble/relink.
+
     Parameters
     ----------
     dir : str
@@ -167,24 +521,49 @@ def generate_tarball(dir: str, out: str, macros: dict):
         Output file
     macros : dict
         Macros for string substitution
+    force : bool
+        Regenerate even if the manifest is up to date
+    jobs : int | None
+        Number of threads to scan and hash with, defaults to the number of CPUs
     """
-    files = _parse_config(dir, macros)
-    tf = tarfile.TarFile(f'{out}.tar', 'w')
+    cache = _RootfsCache(f'{out}.cache')
+    with ThreadPoolExecutor(jobs) as pool:
+        files, _ = _load_config(dir, macros, cache, pool)
+        manifest = _make_manifest(dir, files, macros, cache, pool)
+    cache.save()
+    manifest_file = f'{out}.manifest'
+
+    if not force and os.path.exists(out) and os.path.exists(f'{out}.tar') \
+        and _load_manifest(manifest_file) == manifest:
+        return
+
+    tf = tarfile.TarFile(f'{out}.tar.tmp', 'w')
 
     def filt(file: RootfsFile, ti: tarfile.TarInfo) -> tarfile.TarInfo | None:
         ti.uid = int(file.uid)
         ti.gid = int(file.gid)
         ti.mode = int(file.bits, base=8)
         ti.type = tarfile.REGTYPE
+        # Don't leak the build host's user/group names into the image
+        ti.uname = ''
+        ti.gname = ''
         return ti
 
     for file in files:
-        ti=tarfile.TarInfo()
         tf.add(file.get_abs_path(dir), file.get_arch_name(), True,
                filter = lambda x : filt(file, x))
 
     tf.close()
-    bin2as.bin2as('tar_rootfs', f'{out}.tar', out)
+    tar_changed = _replace_if_changed(f'{out}.tar.tmp', f'{out}.tar')
+
+    bin2as.bin2as('tar_rootfs', f'{out}.tar', f'{out}.tmp')
+    if not _replace_if_changed(f'{out}.tmp', out) and tar_changed:
+        # The .S only references the tarball through .incbin, so it must look newer
+        # whenever the tarball changes, even if its own text is the same.
+        os.utime(out)
+
+    with open(manifest_file, 'w') as fp:
+        json.dump(manifest, fp, indent=1)
 
 
 def main():
@@ -199,9 +578,12 @@ def main():
     print(macros)
 
     if args.t:
-        generate_tarball(args.i, args.o, macros)
+        generate_tarball(args.i, args.o, macros, args.f, args.j)
     else:
-        generate_source(args.i, args.o, macros)
+        generate_source(args.i, args.o, macros, args.j)
+
+    if args.d is not None:
+        write_depfile(args.d, args.o, resolve_files(args.i, macros, f'{args.o}.cache', True, args.j))
 
 
 if __name__ == '__main__':
@@ -193,7 +193,7 @@ def _gen_refs_lds(file: str, syms: set) -> bool:
     Generate a linker script with a bunch of EXTERN() directives
     """
     with open(file, 'w') as fp:
-        for s in syms:
+        for s in sorted(syms):
             fp.write(f'EXTERN({s})\n')
     return True
 
@@ -211,14 +211,14 @@ f"""
 """
         )
         num = 0
-        for sym in syms:
+        for sym in sorted(syms):
             fp.write(f'asm(".set __symref_alias_{num},{sym}\\n");\n')
             fp.write(f'extern void* __symref_alias_{num};\n')
             num += 1
         fp.write('\n#pragma GCC push_options\n#pragma GCC optimize("O0")\n')
         fp.write(f'void __attribute__((used)) {funcname}() {{\n')
         num = 0
-        for sym in syms:
+        for sym in sorted(syms):
             fp.write(f'__symref_alias_{num} = __symref_alias_{num};\n')
             num += 1
         fp.write('}\n')
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------
+# Company    : SLAC National Accelerator Laboratory
+# ----------------------------------------------------------------------------
+# Description : Decodes RTEMS tasks and semaphores from core files or raw
+# memory images, without gdb or a live target. Types and field offsets come
+# from the DWARF info of the application ELF, object walking is shared with
+# the gdb commands (gdb/python/rtems_objects.py).
+# Requires pyelftools (pip install pyelftools).
+# ----------------------------------------------------------------------------
+# This file is part of the rtems-tools package. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the rtems-tools package, including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+# ----------------------------------------------------------------------------
+import os
+import sys
+import json
+import bisect
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), 'gdb', 'python'))
+from rtems_objects import RtemsError, Target, Session, snapshot, print_tasks, print_semaphores
+
+try:
+    from elftools.elf.elffile import ELFFile
+    from elftools.elf.sections import SymbolTableSection
+except ImportError:
+    ELFFile = None
+
+parser = argparse.ArgumentParser(description='Decode RTEMS state from core files or memory images')
+parser.add_argument('-e', '--elf', type=str, required=True, help='Application ELF the dumps were taken from')
+parser.add_argument('-b', '--base', type=str, default=None, help='Load address of raw memory images')
+parser.add_argument('--tasks', action='store_true', help='List tasks')
+parser.add_argument('--sem', action='store_true', help='List semaphores')
+parser.add_argument('--locked', action='store_true', help='Only list locked semaphores')
+parser.add_argument('-j', '--json', type=str, default=None, help='Write a snapshot of each dump (as rtems snapshot) to this directory')
+parser.add_argument('dumps', nargs='+', help='ELF core files or raw memory images')
+
+# DWARF tags that only qualify the type they refer to
+QUALIFIER_TAGS = ['DW_TAG_typedef', 'DW_TAG_const_type', 'DW_TAG_volatile_type', 'DW_TAG_restrict_type', 'DW_TAG_atomic_type']
+
+# DW_ATE_* encodings of base types
+DW_ATE_BOOLEAN = 0x02
+DW_ATE_SIGNED = 0x05
+DW_ATE_SIGNED_CHAR = 0x06
+DW_ATE_UNSIGNED_CHAR = 0x08
+DW_OP_PLUS_UCONST = 0x23
+
+class DwarfType:
+    """
+    A DWARF type DIE, with the type interface of rtems_objects.Target
+
+    Parameters
+    ----------
+    elf : ElfTarget
+        Target the type belongs to, used to complete forward declarations
+    die : DIE
+        Type DIE, qualifiers and typedefs are stripped
+    """
+    CODES = {
+        'DW_TAG_structure_type': 'struct',
+        'DW_TAG_union_type': 'union',
+        'DW_TAG_pointer_type': 'ptr',
+        'DW_TAG_enumeration_type': 'enum',
+        'DW_TAG_array_type': 'array',
+    }
+
+    def __init__(self, elf: 'ElfTarget', die):
+        while die is not None and die.tag in QUALIFIER_TAGS:
+            die = die.get_DIE_from_attribute('DW_AT_type') if 'DW_AT_type' in die.attributes else None
+        if die is not None and 'DW_AT_declaration' in die.attributes:
+            die = elf.definition(die) or die
+        self.elf = elf
+        self.die = die
+        if die is None:
+            self.code = 'void'
+        elif die.tag == 'DW_TAG_base_type':
+            enc = die.attributes['DW_AT_encoding'].value
+            self.code = 'bool' if enc == DW_ATE_BOOLEAN else 'char' if enc in (DW_ATE_SIGNED_CHAR, DW_ATE_UNSIGNED_CHAR) else 'int'
+        else:
+            self.code = self.CODES.get(die.tag, 'other')
+
+    @property
+    def sizeof(self) -> int:
+        if self.die is None:
+            return 1
+        if 'DW_AT_byte_size' in self.die.attributes:
+            return self.die.attributes['DW_AT_byte_size'].value
+        if self.code == 'ptr':
+            return self.die.cu['address_size']
+        if self.code == 'array':
+            n = 1
+            for sub in self.die.iter_children():
+                if 'DW_AT_count' in sub.attributes:
+                    n *= sub.attributes['DW_AT_count'].value
+                elif 'DW_AT_upper_bound' in sub.attributes:
+                    n *= sub.attributes['DW_AT_upper_bound'].value + 1
+            return n * DwarfType(self.elf, self.die.get_DIE_from_attribute('DW_AT_type')).sizeof
+        return 0
+
+    @property
+    def is_signed(self) -> bool:
+        die = self.die
+        if self.code == 'enum' and 'DW_AT_type' in die.attributes:
+            return DwarfType(self.elf, die.get_DIE_from_attribute('DW_AT_type')).is_signed
+        return die is not None and 'DW_AT_encoding' in die.attributes and \
+            die.attributes['DW_AT_encoding'].value in (DW_ATE_SIGNED, DW_ATE_SIGNED_CHAR)
+
+    @staticmethod
+    def _uleb(data: list[int]) -> int:
+        r = 0
+        for i, b in enumerate(data):
+            r |= (b & 0x7F) << (7 * i)
+            if b & 0x80 == 0:
+                break
+        return r
+
+    def fields(self) -> list:
+        r = []
+        for m in self.die.iter_children():
+            if m.tag != 'DW_TAG_member':
+                continue
+            name = m.attributes['DW_AT_name'].value.decode() if 'DW_AT_name' in m.attributes else None
+            bitpos = 0
+            if 'DW_AT_data_bit_offset' in m.attributes:
+                bitpos = m.attributes['DW_AT_data_bit_offset'].value
+            elif 'DW_AT_data_member_location' in m.attributes:
+                loc = m.attributes['DW_AT_data_member_location'].value
+                # DWARF 2 style location expressions are DW_OP_plus_uconst <offset>
+                if isinstance(loc, list):
+                    loc = self._uleb(loc[1:]) if len(loc) > 1 and loc[0] == DW_OP_PLUS_UCONST else 0
+                bitpos = loc * 8
+            r.append((name, bitpos, DwarfType(self.elf, m.get_DIE_from_attribute('DW_AT_type'))))
+        return r
+
+
+class ElfTarget(Target):
+    """
+    An RTEMS system in a core file or raw memory image, described by the application ELF
+
+    Parameters
+    ----------
+    elf : str
+        Application ELF with debug info
+    """
+    def __init__(self, elf: str):
+        self._fp = open(elf, 'rb')
+        self.elf = ELFFile(self._fp)
+        if not self.elf.has_dwarf_info():
+            raise RtemsError(f'{elf} has no debug info')
+        self._types = None
+        self._symbols = None
+        # Sorted list of (start, data). Dumps are searched first, then the ELF's own load segments
+        # (i.e. .text and .rodata missing from a RAM image)
+        self._segments = []
+        self._fallback = self._load_segments(self.elf)
+
+    @property
+    def little_endian(self) -> bool:
+        return self.elf.little_endian
+
+    @property
+    def ptr_size(self) -> int:
+        return self.elf.elfclass // 8
+
+    def _index(self):
+        """Indexes type names, i.e. typedefs and struct tags, to their DIEs. Done once per ELF."""
+        self._types = {}
+        for cu in self.elf.get_dwarf_info().iter_CUs():
+            for die in cu.get_top_DIE().iter_children():
+                if 'DW_AT_name' not in die.attributes:
+                    continue
+                if die.tag in ('DW_TAG_structure_type', 'DW_TAG_union_type', 'DW_TAG_enumeration_type'):
+                    key = (die.tag, die.attributes['DW_AT_name'].value.decode())
+                elif die.tag in ('DW_TAG_typedef', 'DW_TAG_base_type'):
+                    key = ('type', die.attributes['DW_AT_name'].value.decode())
+                else:
+                    continue
+                # Prefer complete definitions over forward declarations
+                if key not in self._types or 'DW_AT_declaration' in self._types[key].attributes:
+                    self._types[key] = die
+
+    def definition(self, die):
+        """Returns the definition of a forward declared struct/union, or None"""
+        if self._types is None:
+            self._index()
+        if 'DW_AT_name' not in die.attributes:
+            return None
+        d = self._types.get((die.tag, die.attributes['DW_AT_name'].value.decode()))
+        return None if d is None or 'DW_AT_declaration' in d.attributes else d
+
+    def lookup_type(self, name: str):
+        if self._types is None:
+            self._index()
+        for tag in ('type', 'DW_TAG_structure_type', 'DW_TAG_union_type'):
+            if (tag, name) in self._types:
+                return DwarfType(self, self._types[(tag, name)])
+        return None
+
+    def symbol(self, name: str) -> int | None:
+        if self._symbols is None:
+            self._symbols = {}
+            for sec in self.elf.iter_sections():
+                if isinstance(sec, SymbolTableSection):
+                    for sym in sec.iter_symbols():
+                        if sym['st_info']['type'] in ('STT_OBJECT', 'STT_FUNC', 'STT_NOTYPE') and sym['st_shndx'] != 'SHN_UNDEF':
+                            self._symbols.setdefault(sym.name, sym['st_value'])
+        return self._symbols.get(name)
+
+    @staticmethod
+    def _load_segments(elf) -> list[tuple[int, bytes]]:
+        segs = [(s['p_vaddr'], s.data()) for s in elf.iter_segments() if s['p_type'] == 'PT_LOAD' and s['p_filesz'] > 0]
+        return sorted(segs, key=lambda x: x[0])
+
+    def load(self, path: str, base: int | None = None):
+        """
+        Loads the memory of a dump, replacing the previous one
+
+        Parameters
+        ----------
+        path : str
+            ELF core file, or a raw memory image
+        base : int | None
+            Address of the start of a raw image
+        """
+        with open(path, 'rb') as fp:
+            data = fp.read()
+        if data[:4] == b'\x7fELF':
+            with open(path, 'rb') as fp:
+                self._segments = self._load_segments(ELFFile(fp))
+        elif base is None:
+            raise RtemsError(f'{path} is a raw memory image, its load address must be given with --base')
+        else:
+            self._segments = [(base, data)]
+
+    def read(self, addr: int, size: int) -> bytes:
+        for segs in (self._segments, self._fallback):
+            i = bisect.bisect_right(segs, addr, key=lambda x: x[0]) - 1
+            if i >= 0 and addr + size <= segs[i][0] + len(segs[i][1]):
+                return segs[i][1][addr - segs[i][0]:addr - segs[i][0] + size]
+        raise RtemsError(f'Cannot access memory at {hex(addr)}, not in the dump')
+
+
+def main():
+    args = parser.parse_args()
+    if ELFFile is None:
+        print('pyelftools is required to read DWARF info, install it with: pip install pyelftools')
+        exit(1)
+
+    try:
+        target = ElfTarget(args.elf)
+        session = Session(target)
+        for path in args.dumps:
+            # Types and offsets are looked up once per ELF, only memory is reloaded per dump
+            target.load(path, None if args.base is None else int(args.base, 0))
+            session.invalidate_memory()
+            if len(args.dumps) > 1:
+                print(f'==> {path} <==')
+            if args.tasks or not (args.sem or args.json):
+                print_tasks(session)
+            if args.sem:
+                print_semaphores(session, args.locked)
+            if args.json is not None:
+                os.makedirs(args.json, exist_ok=True)
+                with open(os.path.join(args.json, os.path.basename(path) + '.json'), 'w') as fp:
+                    json.dump(snapshot(session), fp, indent=1)
+    except (RtemsError, OSError) as e:
+        print(e)
+        exit(1)
+
+if __name__ == '__main__':
+    main()
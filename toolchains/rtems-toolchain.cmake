@@ -46,6 +46,7 @@ set(CMAKE_ASM_COMPILER "${RTEMS_ARCH}-rtems${RTEMS_TOOL_VERSION}-gcc")
 set(CMAKE_LINKER "${RTEMS_ARCH}-rtems${RTEMS_TOOL_VERSION}-ld")
 set(CMAKE_AR "${RTEMS_ARCH}-rtems${RTEMS_TOOL_VERSION}-ar")
 set(CMAKE_OBJCOPY "${RTEMS_ARCH}-rtems${RTEMS_TOOL_VERSION}-objcopy")
+set(CMAKE_SIZE "${RTEMS_ARCH}-rtems${RTEMS_TOOL_VERSION}-size")
 set(CMAKE_RTEMS_LD "rtems-ld")
 set(CMAKE_RTEMS_XSYMS "rtems-xsyms")
 set(CMAKE_RTEMS_SYMS "rtems-syms")
@@ -67,12 +68,50 @@ if (DEFINED RTEMS_TOP)
     set(CMAKE_LINKER "${RTEMS_TOP}/host/${HOST_DIR}/bin/${CMAKE_LINKER}")
     set(CMAKE_AR "${RTEMS_TOP}/host/${HOST_DIR}/bin/${CMAKE_AR}")
     set(CMAKE_OBJCOPY "${RTEMS_TOP}/host/${HOST_DIR}/bin/${CMAKE_OBJCOPY}")
+    set(CMAKE_SIZE "${RTEMS_TOP}/host/${HOST_DIR}/bin/${CMAKE_SIZE}")
     set(CMAKE_RTEMS_SYMS "${RTEMS_TOP}/host/${HOST_DIR}/bin/rtems-syms")
     set(CMAKE_RTEMS_LD "${RTEMS_TOP}/host/${HOST_DIR}/bin/rtems-ld")
     set(CMAKE_RTEMS_XSYMS "${RTEMS_TOP}/host/${HOST_DIR}/bin/rtems-xsyms")
     set(CMAKE_DTC "${RTEMS_TOP}/host/${HOST_DIR}/bin/dtc")
 endif()
 
+#
+# Compiler launcher. RTEMS_COMPILER_LAUNCHER may be set to auto (the default, uses ccache or
+# sccache if found), ccache, sccache or none.
+# For ccache, paths below the source directory are made relative (CCACHE_BASEDIR) and the
+# working directory is not hashed, so per-BSP build directories share cache entries.
+#
+if (NOT DEFINED RTEMS_COMPILER_LAUNCHER)
+    set(RTEMS_COMPILER_LAUNCHER "auto")
+endif()
+list(APPEND CMAKE_TRY_COMPILE_PLATFORM_VARIABLES RTEMS_COMPILER_LAUNCHER)
+
+# RTEMS_LAUNCHER_PROGRAM is a cache variable, search again when a different launcher is requested
+if (NOT "${RTEMS_COMPILER_LAUNCHER}" STREQUAL "${RTEMS_LAUNCHER_REQUESTED}")
+    unset(RTEMS_LAUNCHER_PROGRAM CACHE)
+    set(RTEMS_LAUNCHER_REQUESTED "${RTEMS_COMPILER_LAUNCHER}" CACHE INTERNAL "")
+endif()
+
+if ("${RTEMS_COMPILER_LAUNCHER}" STREQUAL "auto")
+    find_program(RTEMS_LAUNCHER_PROGRAM NAMES ccache sccache)
+elseif (NOT "${RTEMS_COMPILER_LAUNCHER}" MATCHES "^([Nn][Oo][Nn][Ee]|[Oo][Ff][Ff]|[Nn][Oo]|[Ff][Aa][Ll][Ss][Ee]|0)$")
+    find_program(RTEMS_LAUNCHER_PROGRAM NAMES "${RTEMS_COMPILER_LAUNCHER}")
+else()
+    unset(RTEMS_LAUNCHER_PROGRAM CACHE)
+    unset(RTEMS_LAUNCHER_PROGRAM)
+endif()
+
+if (RTEMS_LAUNCHER_PROGRAM)
+    get_filename_component(RTEMS_LAUNCHER_NAME "${RTEMS_LAUNCHER_PROGRAM}" NAME)
+    if ("${RTEMS_LAUNCHER_NAME}" STREQUAL "ccache")
+        set(RTEMS_LAUNCHER_COMMAND "${CMAKE_COMMAND};-E;env;CCACHE_BASEDIR=${CMAKE_SOURCE_DIR};CCACHE_NOHASHDIR=1;${RTEMS_LAUNCHER_PROGRAM}")
+    else()
+        set(RTEMS_LAUNCHER_COMMAND "${RTEMS_LAUNCHER_PROGRAM}")
+    endif()
+    set(CMAKE_C_COMPILER_LAUNCHER "${RTEMS_LAUNCHER_COMMAND}")
+    set(CMAKE_CXX_COMPILER_LAUNCHER "${RTEMS_LAUNCHER_COMMAND}")
+endif()
+
 set(CMAKE_FIND_ROOT_PATH_MODE_PROGRAM NEVER)
 set(CMAKE_FIND_ROOT_PATH_MODE_LIBRARY ONLY)
 set(CMAKE_FIND_ROOT_PATH_MODE_INCLUDE ONLY)
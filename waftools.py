@@ -19,12 +19,17 @@ from waflib.TaskGen import feature, extension
 import waflib.TaskGen as Taskgen
 import waflib
 import os
+import re
 import sys
 import tools.findlibs as findlibs
 
 # HACK! I still want mkrootfs to run w/o a real package.
 sys.path.append(os.path.dirname(__file__))
 import mkrootfs
+import mkimage
+
+# Location of mksyms.py, ldep.py and the sym/ configs
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
 
 rtems_version = "7"
 
@@ -107,7 +112,8 @@ def install_libs(bld, libs: list[str], subdir: str = ''):
 def build_module(bld, target: str, sources: list[str] = [], includes: list[str] = [], ldflags: list[str] = [], libs: list[str] = []):
     """
     Builds the specified module with the specified properties.
-    Does not link to the standard library or any other RTEMS libraries by default
+    Does not link to the standard library or any other RTEMS libraries by default.
+    This is shorthand for a task generator with the 'rtems_module' feature.
 
     Parameters
     ----------
@@ -122,39 +128,14 @@ def build_module(bld, target: str, sources: list[str] = [], includes: list[str]
     ldflags : list[str]
         Linker flags to append
     libs : list[str]
-        Libraries to link against
+        Libraries to link against, either -l<name> or paths to the library files
     """
-
-    includes = includes.copy()
-    includes.extend(get_includes(bld))
-
-    def link_task(task):
-        cmd = [
-            bld.env.CC[0],
-            '-o',
-            task.outputs[0].abspath(),
-            '-nostdlib',
-            '-Wl,-r',
-        ]
-        cmd.extend(bld.env.CFLAGS)
-        cmd.extend(bld.env.CPPFLAGS)
-        cmd.extend([f'-L{x}' for x in get_lib_paths(bld)])
-        # Relative to build dir
-        cmd.extend([bld.env.CPPPATH_ST % x for x in task.generator.includes])
-        # Relative to srcdir
-        cmd.extend([bld.env.CPPPATH_ST % f'{bld.top_dir}/{x}' for x in task.generator.includes])
-        cmd.extend(task.generator.ldflags)
-        cmd.extend([x.abspath() for x in task.inputs])
-        cmd.extend(task.generator.libs)
-        print(' '.join(cmd))
-        return task.exec_command(cmd)
-
     bld(
-        rule=link_task,
-        source=[sources],
-        includes=includes,
-        libs=libs,
-        ldflags=ldflags,
+        features='c rtems_module',
+        source=sources,
+        includes=includes + get_includes(bld),
+        module_ldflags=ldflags,
+        module_libs=libs,
         target=target
     )
 
@@ -163,7 +144,8 @@ def build_module(bld, target: str, sources: list[str] = [], includes: list[str]
 
 def check_headers(conf, headers: dict, allow_failure: bool = True):
     """
-    Checks for a list of headers and generates a define for them
+    Checks for a list of headers and generates a define for them.
+    All headers are probed in one batch, see has_c_headers.
 
     Parameters
     ----------
@@ -174,17 +156,10 @@ def check_headers(conf, headers: dict, allow_failure: bool = True):
     allow_failure : bool
         Allow failure of the check or not
     """
-    for k, v in headers.items():
-        try:
-            conf.check_cc(
-                use='rtemsdefaultconfig',
-                header_name=k,
-                features='c',
-                define_name=v
-            )
-        except Exception as e:
-            if not allow_failure:
-                raise e
+    found = has_c_headers(conf, list(headers.keys()), defines=headers)
+    missing = [k for k, v in found.items() if not v]
+    if len(missing) > 0 and not allow_failure:
+        conf.fatal(f'Missing required headers: {", ".join(missing)}')
 
 
 def has_c_header(conf, header: str) -> bool:
@@ -233,10 +208,210 @@ def has_lib(conf, libs: list[str]) -> bool:
         return False
     return True
 
+def _probe_headers(conf, headers: list[str], system: bool = True, use: list[str] = []) -> dict[str, bool] | None:
+    """
+    Probes for a list of headers with a single preprocessor run, using __has_include.
+    The flags of the uselib names in use are added, as check_cc(use=...) would.
+    Returns None if the compiler can't do it (no __has_include, or the run failed).
+    """
+    lines = ['#ifdef __has_include', '#define WAFTOOLS_PROBE_OK 1']
+    for i, h in enumerate(headers):
+        name = f'<{h}>' if system else f'"{h}"'
+        lines += [f'#if __has_include({name})', f'#define WAFTOOLS_HAS_{i} 1', '#endif']
+    lines.append('#endif')
+
+    node = conf.bldnode.make_node(f'{conf.env.RTEMS_ARCH_BSP}/.conf_probe_headers.c')
+    node.parent.mkdir()
+    node.write('\n'.join(lines) + '\n')
+
+    sfx = [''] + [f'_{x}' for x in use]
+    cmd = [conf.env.CC[0]]
+    for x in sfx:
+        cmd += conf.env[f'CFLAGS{x}'] + conf.env[f'CPPFLAGS{x}']
+    for x in sfx:
+        cmd += [conf.env.CPPPATH_ST % y for y in conf.env[f'INCLUDES{x}']]
+        cmd += [conf.env.DEFINES_ST % y for y in conf.env[f'DEFINES{x}']]
+    cmd += ['-E', '-dM', node.abspath()]
+    try:
+        out = conf.cmd_and_log(cmd, output=Context.STDOUT, quiet=Context.BOTH)
+    except conf.errors.WafError:
+        return None
+
+    defined = set([x.split(' ')[1] for x in out.splitlines() if x.startswith('#define ')])
+    if 'WAFTOOLS_PROBE_OK' not in defined:
+        return None
+    return {h: f'WAFTOOLS_HAS_{i}' in defined for i, h in enumerate(headers)}
+
+
+def _multicheck(conf, checks: list[dict], msg: str) -> list[bool]:
+    """
+    Runs independent conf.check_cc tests as parallel compiles through waf's multicheck, and returns
+    whether each passed. Results are collected through temporary defines which are removed afterwards.
+    """
+    if len(checks) == 0:
+        return []
+    keys = [f'WAFTOOLS_CHECK_{i}' for i in range(len(checks))]
+    conf.multicheck(
+        *[dict(c, define_name=k, mandatory=False) for c, k in zip(checks, keys)],
+        msg=msg,
+        mandatory=False
+    )
+    res = [conf.is_defined(k) for k in keys]
+    conf.env.DEFINES = [x for x in conf.env.DEFINES if x.split('=')[0] not in keys]
+    conf.env.define_key = [x for x in conf.env.define_key if x not in keys]
+    for k in keys:
+        if k in conf.env:
+            del conf.env[k]
+    return res
+
+
+def _batch_check_headers(conf, headers: list[str], system: bool, compile, single, use: list[str] = []) -> dict[str, bool]:
+    """
+    Common part of the batched header checks. Probes everything with _probe_headers, then confirms
+    the hits with one compile(found) check. The probe's misses, and the hits if they don't compile
+    together, are confirmed through _multicheck with single(header) -> check_cc kwargs.
+    """
+    found = _probe_headers(conf, headers, system, use)
+    if found is None:
+        found = {h: True for h in headers}
+    hits = [h for h in headers if found[h]]
+
+    # Most of the time the hits all compile together, which settles them in one go. A miss is only
+    # trusted once a real check agrees, the probe may lack flags that check_cc would pass
+    retry = [h for h in headers if not found[h]]
+    if len(hits) > 0 and not compile(hits):
+        retry = headers
+    if len(retry) > 0:
+        res = _multicheck(conf, [single(h) for h in retry], f'Checking {len(retry)} headers in parallel')
+        found.update(dict(zip(retry, res)))
+
+    for h in headers:
+        conf.msg(f'Checking for {h}', 'yes' if found[h] else 'no', 'GREEN' if found[h] else 'YELLOW')
+    return found
+
+
+def has_c_headers(conf, headers: list[str], defines: dict | None = None) -> dict[str, bool]:
+    """
+    Batched variant of has_c_header. The headers are probed with one preprocessor run and the hits
+    confirmed with one compile. Misses, and the hits when that compile fails, are checked one by
+    one as parallel compiles. Each header gets the define of conf.check_cc(header_name=...)
+    (HAVE_<HEADER> unless overridden by defines): set to 1 when found, undefined otherwise, with
+    the env variable of the same name set to 1 or 0.
+
+    Parameters
+    ----------
+    conf :
+        Config context
+    headers : list[str]
+        Headers to check for
+    defines : dict | None
+        Optional mapping of header -> define name
+
+    Returns
+    -------
+    dict[str, bool] :
+        Mapping of header -> found
+    """
+    def compile(hits: list[str]) -> bool:
+        try:
+            conf.check_cc(
+                use='rtemsdefaultconfig',
+                fragment=''.join([f'#include <{h}>\n' for h in hits]) + 'int main(void) { return 0; }\n',
+                features='c',
+                msg=f'Checking {len(hits)} headers'
+            )
+        except conf.errors.ConfigurationError:
+            return False
+        return True
+
+    def single(h: str) -> dict:
+        return {'use': 'rtemsdefaultconfig', 'header_name': h, 'features': 'c'}
+
+    found = _batch_check_headers(conf, headers, True, compile, single, ['rtemsdefaultconfig'])
+    for h, v in found.items():
+        name = defines[h] if defines is not None and h in defines else conf.have_define(h)
+        conf.define_cond(name, v)
+        conf.env[name] = int(v)
+    return found
+
+
+def check_includes(conf, includes: dict, system: bool = False, add_to_defines: bool = True) -> dict[str, bool]:
+    """
+    Batched variant of check_include, sets the same variables and defines.
+
+    Parameters
+    ----------
+    conf :
+        Configuration context
+    includes : dict
+        Mapping of include -> variable to set
+    system : bool
+        When true, include with arrow brackets
+    add_to_defines: bool
+        When true, add to the list of C/C++ #defines
+
+    Returns
+    -------
+    dict[str, bool] :
+        Mapping of include -> found
+    """
+    def code(h: str) -> str:
+        return f'#include <{h}>' if system else f'#include "{h}"'
+
+    def compile(hits: list[str]) -> bool:
+        try:
+            conf.check_cc(
+                fragment=rtems.test_application([code(h) for h in hits]),
+                execute=False,
+                msg=f'Checking {len(hits)} includes'
+            )
+        except conf.errors.WafError:
+            return False
+        return True
+
+    def single(h: str) -> dict:
+        return {'fragment': rtems.test_application([code(h)]), 'execute': False}
+
+    found = _batch_check_headers(conf, list(includes.keys()), system, compile, single)
+    for h, var in includes.items():
+        if found[h] and add_to_defines:
+            conf.env.DEFINES += [f'{var}=1']
+        setattr(conf.env, var, found[h])
+    return found
+
+
+def has_libs(conf, libs: list[list[str]]) -> list[bool]:
+    """
+    Batched variant of has_lib. Each entry is checked as in has_lib, with the link tests running
+    in parallel.
+
+    Parameters
+    ----------
+    conf :
+        Config context
+    libs : list[list[str]]
+        List of library sets to check for
+
+    Returns
+    -------
+    list[bool] :
+        Whether each set of libraries was found
+    """
+    res = _multicheck(
+        conf,
+        [{'use': x + ['rtemsdefaultconfig'], 'features': 'cprogram'} for x in libs],
+        f'Checking {len(libs)} libraries in parallel'
+    )
+    for x, r in zip(libs, res):
+        conf.msg(f'Checking for {" ".join(x)}', 'yes' if r else 'no', 'GREEN' if r else 'YELLOW')
+    return res
+
+
 def add_rootfs(bld, dir: str, file: str = 'rootfs.S', macros: dict = {}, tarball: bool = True):
     """
     Adds a directory as the rootfs. This directory should contain a rootfs.txt file
     describing the files to be installed, their destination, permissions, ownership, etc.
+    Entries in rootfs.txt may also be directories or glob patterns, see mkrootfs._parse_config.
 
     Operates in two modes: tarball and custom. 'Custom' mode effectively embeds each
     file individually and generates the code needed to write them out with proper permissions.
@@ -275,12 +450,31 @@ def add_rootfs(bld, dir: str, file: str = 'rootfs.S', macros: dict = {}, tarball
                 macros
             )
 
-    return bld(
-        name=f'{bld.out_dir}/{bld.env.RTEMS_ARCH_BSP}/{file}',
-        target=f'{bld.out_dir}/{bld.env.RTEMS_ARCH_BSP}/{file}',
-        source=[f'{dir}/rootfs.txt'],
-        rule=generate
+    # Every embedded file is a task input, so the task signature covers their contents.
+    # rootfs.txt must remain the first input, generate() relies on it.
+    rootdir = bld.path.find_dir(dir)
+    if rootdir is None:
+        bld.fatal(f'Could not find rootfs directory {dir}')
+    sources = []
+    out = f'{bld.out_dir}/{bld.env.RTEMS_ARCH_BSP}/{file}'
+    for x in mkrootfs.resolve_files(rootdir.abspath(), macros, f'{out}.cache'):
+        n = bld.root.find_node(x)
+        if n is None:
+            bld.fatal(f'Could not find rootfs file {x}')
+        sources.append(n)
+
+    tg = bld(
+        name=out,
+        target=out,
+        source=sources,
+        rule=generate,
+        vars=['ROOTFS_MACROS', 'ROOTFS_TARBALL']
     )
+    # Macro values and the generation mode are part of the signature as well
+    tg.env = tg.env.derive()
+    tg.env.ROOTFS_MACROS = sorted(macros.items())
+    tg.env.ROOTFS_TARBALL = tarball
+    return tg
 
 
 def check_include(conf, include: str, var: str, system: bool = False, add_to_defines: bool = True) -> bool:
@@ -327,9 +521,29 @@ def check_include(conf, include: str, var: str, system: bool = False, add_to_def
     return True
 
 
-def write_config_h(conf, template: str, name: str | None = None):
+def _config_value(v) -> str | None:
+    """
+    Formats an env value for write_config_h. Returns None for values that have no C representation.
+    """
+    if type(v) == bool:
+        return str(1 if v else 0)
+    if type(v) in [int, float]:
+        return str(v)
+    if isinstance(v, list):
+        if not all([type(x) in [str, int, float] for x in v]):
+            return None
+        v = ' '.join([str(x) for x in v])
+    if isinstance(v, str):
+        return '"' + v.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return None
+
+
+def write_config_h(conf, template: str, name: str | None = None) -> list[str]:
     """
     Writes out a config.h header in the build area for this arch/bsp.
+    @VAR@ placeholders are replaced with the value of VAR in conf.env: numbers as is, bools
+    as 1/0, strings (and lists, joined by spaces) as quoted C strings. The file is only
+    rewritten when its contents change, so dependent sources aren't rebuilt needlessly.
 
     NOTE: This should be called during the build step as a pre function!
 
@@ -341,6 +555,11 @@ def write_config_h(conf, template: str, name: str | None = None):
         Template file to substitute
     name : str | None
         Name of the config.h file. If None, it is determined by stripping the .in suffix from template.
+
+    Returns
+    -------
+    list[str] :
+        Placeholders that could not be resolved. These are left in the output as-is.
     """
     with open(template, 'r') as fp:
         tpl = fp.read()
@@ -348,18 +567,34 @@ def write_config_h(conf, template: str, name: str | None = None):
     if name is None:
         name = os.path.basename(template).removesuffix('.in')
 
-    for k in conf.env:
-        v = getattr(conf.env, k)
-        if type(v) in [int, float]:
-            tpl = tpl.replace(f'@{k}@', str(v))
-        elif type(v) == bool:
-            tpl = tpl.replace(f'@{k}@', str(1 if v else 0))
-        else:
-            tpl = tpl.replace(f'@{k}@', f'"str(v)"')
+    unresolved = []
+    def subst(m: re.Match) -> str:
+        k = m.group(1)
+        v = _config_value(conf.env[k]) if k in conf.env else None
+        if v is None:
+            if k not in unresolved:
+                unresolved.append(k)
+            return m.group(0)
+        return v
+
+    out = re.sub(r'@([A-Za-z_][A-Za-z0-9_]*)@', subst, tpl)
+
+    file = f'{conf.out_dir}/{conf.env.RTEMS_ARCH_BSP}/{name}'
+    try:
+        with open(file, 'r') as fp:
+            changed = fp.read() != out
+    except OSError:
+        changed = True
+
+    if changed:
+        os.makedirs(os.path.dirname(file), exist_ok=True, mode=0o777)
+        with open(f'{file}.tmp', 'w') as fp:
+            fp.write(out)
+        os.replace(f'{file}.tmp', file)
 
-    os.makedirs(f'{conf.out_dir}/{conf.env.RTEMS_ARCH_BSP}/', exist_ok=True, mode=0o777)
-    with open(f'{conf.out_dir}/{conf.env.RTEMS_ARCH_BSP}/{name}', 'w') as fp:
-        fp.write(tpl)
+    if len(unresolved) > 0:
+        conf.msg(f'Unresolved placeholders in {name}', ', '.join(unresolved), 'YELLOW')
+    return unresolved
 
 
 def check_net_stack(conf, lib: str, name: str):
@@ -390,38 +625,66 @@ def check_net_stack(conf, lib: str, name: str):
     return False
 
 
-def check_lib(conf, lib: str, symbol: str, variable: str) -> bool:
+def _symbol_index(conf) -> findlibs.SymbolIndex:
+    """
+    Returns the symbol index for this configure run. It's stored in the build directory and
+    shared by all BSP variants, entries are keyed by library path and mtime.
+    """
+    idx = getattr(conf, 'symbol_index', None)
+    if idx is None:
+        idx = findlibs.SymbolIndex(f'{conf.bldnode.abspath()}/symindex.json')
+        conf.symbol_index = idx
+    return idx
+
+
+def check_lib(conf, lib: str, symbol: str | list[str], variable: str) -> bool:
     """
     Performs a "library check", searching for 'symbol' in 'lib' and setting
     a variable on the environment to indicate if it's found.
+    Each library is scanned with nm only once, no matter how many symbols are checked.
     
     Parameters
     ----------
     lib : str
         Library name (without lib prefix or path)
-    symbol : str
-        Name of the symbol
+    symbol : str | list[str]
+        Name of the symbol, or a list of symbols that must all be present
     variable : str
         Name of the variable to set in conf.env
     """
+    syms = [symbol] if isinstance(symbol, str) else list(symbol)
+    what = ', '.join(syms)
+
     # Default to false
     conf.env[variable] = False
 
-    # Find the library file itself
+    # Find the library file itself. The lookup spawns the compiler, so remember it for this run
     args = [f'-B{conf.env.RTEMS_PATH}/{conf.env.RTEMS_ARCH_RTEMS}/{conf.env.RTEMS_BSP}']
-    l = findlibs.find_lib(
-        conf.env.CC[0],
-        findlibs.make_lib_name(lib),
-        args,
-    )
+    lookups = getattr(conf, 'lib_lookups', None)
+    if lookups is None:
+        lookups = conf.lib_lookups = {}
+    key = (conf.env.CC[0], lib, tuple(args))
+    if key not in lookups:
+        lookups[key] = findlibs.find_lib(
+            conf.env.CC[0],
+            findlibs.make_lib_name(lib),
+            args,
+        )
+    l = lookups[key]
 
     if l is None:
-        conf.msg(f'Checking for {symbol} in {lib}', 'no', 'YELLOW')
+        conf.msg(f'Checking for {what} in {lib}', 'no', 'YELLOW')
         return False
 
-    found = findlibs.check_sym(l, symbol, conf.env.NM[0])
-    conf.msg(f'Checking for {symbol} in {lib}', 'no' if not found else 'yes', 'GREEN' if found else 'YELLOW')
-    conf.env[variable] = True
+    idx = _symbol_index(conf)
+    idx.nm = conf.env.NM[0]
+    res = idx.check(l, syms)
+    idx.save()
+
+    found = all(res.values())
+    missing = [k for k, v in res.items() if not v]
+    conf.msg(f'Checking for {what} in {lib}', 'yes' if found else f'no ({", ".join(missing)} missing)', 'GREEN' if found else 'YELLOW')
+    conf.env[variable] = found
     return found
 
 def report_feature(ctx, feature: str, enabled: bool, msg: tuple[str, str] = ('enabled', 'disabled')):
@@ -438,26 +701,302 @@ If your app's name is 'my-app.exe', it will generate a 'my-app.boot' for you.
 
 Simply add to your app's 'features' list
 """
+class uimage(Task):
+    """
+    Generates a U-Boot image from the flat .boot binary with mkimage.py
+    """
+    color = 'YELLOW'
+    vars = ['UIMAGE_ARGS']
+
+    def run(self):
+        arch, load, entry, name, comp = self.env.UIMAGE_ARGS
+        try:
+            mkimage.generate_uimage(self.inputs[0].abspath(), self.outputs[0].abspath(), arch, load, entry, name, comp)
+        except (ValueError, OSError) as e:
+            self.generator.bld.to_log(f'{e}\n')
+            return 1
+        return 0
+
+    def __str__(self):
+        return f'Generating {self.outputs[0].name}'
+
+
+class boot_objcopy(Task):
+    """
+    Converts the linked executable into a flat binary with objcopy
+    """
+    color = 'YELLOW'
+    vars = ['OBJCOPY']
+
+    def run(self):
+        return self.exec_command(self.env.OBJCOPY + ['-O', 'binary', self.inputs[0].abspath(), self.outputs[0].abspath()])
+
+    def __str__(self):
+        return f'Generating {self.outputs[0].name}'
+
+
 @feature('boot')
-@Taskgen.after('process_use')
+@Taskgen.after('process_use', 'apply_syms_stage2')
 def generate_boot_file(self):
-    path = f"{self.bld.out_dir}/{self.env.RTEMS_ARCH_BSP}/{self.target}"
-    out = os.path.splitext(path)[0] + '.boot'
+    """
+    Generates <target>.boot, a flat binary of the linked executable (the stage 2 executable with the
+    symbol table if the rtems_syms feature is used). If boot_loadaddr is set, also generates a
+    U-Boot image <target>.img from it.
 
-    class bootTask(Task):
-        color = 'YELLOW'
+    Attributes
+    ----------
+    boot_loadaddr : int
+        Load address of the U-Boot image
+    boot_entry : int
+        Entry point of the U-Boot image, defaults to boot_loadaddr
+    boot_name : str
+        Name of the U-Boot image, defaults to RTEMS
+    boot_comp : str
+        Compression of the U-Boot image: none, gzip (default) or lzma
+    """
+    exe = self.stage2_task if getattr(self, 'stage2_task', None) is not None else self.link_task
+    stem = os.path.splitext(os.path.basename(self.target))[0]
+    boot = exe.outputs[0].parent.find_or_declare(f'{stem}.boot')
+    self.create_task('boot_objcopy', exe.outputs[0], boot)
+
+    load = getattr(self, 'boot_loadaddr', None)
+    if load is not None:
+        img = self.create_task('uimage', boot, boot.parent.find_or_declare(f'{stem}.img'))
+        img.env.UIMAGE_ARGS = [
+            self.env.RTEMS_ARCH_RTEMS.split('-')[0],
+            load,
+            getattr(self, 'boot_entry', load),
+            getattr(self, 'boot_name', 'RTEMS'),
+            getattr(self, 'boot_comp', 'gzip'),
+        ]
 
-        def __init__(self, *args, **kws):
-            super().__init__(*args, **kws)
-            # Always run after the linker task...
-            self.run_after.add(self.generator.link_task)
 
-        def run(self):
-            return 0 != self.exec_command(
-                f"{self.env.OBJCOPY[0]} -O binary {path} {out}"
-            )
+class mksyms(Task):
+    """
+    Runs mksyms.py. Inputs are the symbol config, mksyms.py itself and the libraries it scans,
+    the command line is part of the signature through MKSYMS_ARGS.
+    """
+    color = 'BLUE'
+    vars = ['MKSYMS_ARGS']
+
+    def run(self):
+        return self.exec_command([sys.executable, f'{TOOLS_DIR}/mksyms.py', '-o', self.outputs[0].abspath()] + self.env.MKSYMS_ARGS)
+
+    def __str__(self):
+        return f'Generating {self.outputs[0].name}'
 
-        def __str__(self):
-            return f'Generating {os.path.basename(out)}'
 
-    t = self.create_task('bootTask')
+class ldep(Task):
+    """
+    Runs ldep.py to generate symbol refs (C source and linker script) for a list of libraries
+    """
+    color = 'BLUE'
+    vars = ['MKSYMS_ARGS']
+
+    def run(self):
+        return self.exec_command(
+            [sys.executable, f'{TOOLS_DIR}/ldep.py', '-c', self.outputs[0].abspath(), '-e', self.outputs[1].abspath(),
+             '-O', self.outputs[0].parent.abspath()] + self.env.MKSYMS_ARGS
+        )
+
+    def __str__(self):
+        return f'Generating {self.outputs[1].name}'
+
+
+class rtems_syms(Task):
+    """
+    Runs rtems-syms on the stage 1 ELF to generate the embedded symbol table object
+    """
+    color = 'BLUE'
+    vars = ['RTEMS_SYMS', 'CC', 'CFLAGS']
+
+    def run(self):
+        return self.exec_command(
+            self.env.RTEMS_SYMS + ['-e', '-C', self.env.CC[0], '-c', ' '.join(self.env.CFLAGS),
+             '-m', self.outputs[1].abspath(), '-o', self.outputs[0].abspath(), self.inputs[0].abspath()]
+        )
+
+    def __str__(self):
+        return f'Generating {self.outputs[0].name}'
+
+
+def _find_lib_node(tg, lib: str, dirs: list[str], mandatory: bool = True):
+    """
+    Resolves -l<lib> to a node. Libraries built by this project resolve to their link output, others
+    are searched for in dirs and then in the compiler's search path.
+    Returns None if the library can't be found and mandatory is False.
+    """
+    try:
+        other = tg.bld.get_tgen_by_name(lib)
+    except waflib.Errors.WafError:
+        other = None
+    if other is not None:
+        other.post()
+        return other.link_task.outputs[0]
+
+    for d in dirs:
+        if os.path.exists(f'{d}/lib{lib}.a'):
+            return tg.bld.root.find_node(f'{d}/lib{lib}.a')
+
+    path = findlibs.find_lib(tg.env.CC[0], findlibs.make_lib_name(lib), [f'-B{x}' for x in dirs])
+    if path is None and not mandatory:
+        return None
+    if path is None:
+        tg.bld.fatal(f'{tg.name}: could not find -l{lib} for the symbol table')
+    return tg.bld.root.find_node(os.path.abspath(path))
+
+
+@feature('rtems_syms')
+@Taskgen.before_method('process_source')
+def apply_mksyms(self):
+    """
+    Equivalent of rtems_add_executable + rtems_include_libs for waf. Add 'rtems_syms' to a cprogram's
+    features to link a stage 2 executable with an embedded symbol table for the RTEMS runtime linker:
+
+      bld(features='c cprogram rtems_syms', target='app', source=[...],
+          syms_libs=['bsd'], syms_libdirs=[...], syms_ldep=False, syms_config='sym/base-symbols.toml')
+
+    The symbol refs (mksyms or ldep), the stage 1 link, rtems-syms and the stage 2 link (<target>.exe)
+    are all separate tasks with proper signatures, so only the steps whose inputs changed are rerun.
+
+    Attributes
+    ----------
+    syms_libs : list[str]
+        Libraries to pull in completely, so modules loaded at runtime can use them
+    syms_libdirs : list[str]
+        Extra directories to search for syms_libs
+    syms_ldep : bool
+        Use ldep instead of mksyms to generate the refs for syms_libs
+    syms_config : str
+        Symbol config for the base refs, defaults to sym/base-symbols.toml from this package
+    """
+    arch = self.env.RTEMS_ARCH_RTEMS.split('-')[0]
+    prefix = self.env.CC[0].removesuffix('gcc')
+    out = self.path.get_bld()
+    config = getattr(self, 'syms_config', f'{TOOLS_DIR}/sym/base-symbols.toml')
+    config = self.bld.root.find_node(os.path.abspath(config)) if os.path.isabs(config) else self.path.find_node(config)
+    if config is None:
+        self.bld.fatal(f'{self.name}: could not find symbol config')
+    tools = self.bld.root.find_node(f'{TOOLS_DIR}/mksyms.py')
+
+    # Base symbol refs, compiled into both stages
+    extra = out.find_or_declare(f'{self.target}-extra-syms.c')
+    t = self.create_task('mksyms', [config, tools], extra)
+    t.env.MKSYMS_ARGS = ['-a', arch, '-c', config.abspath()]
+    self.source = self.to_nodes(getattr(self, 'source', [])) + [extra]
+
+    # Keep the ref function (and everything it references) through --gc-sections
+    self.env.append_value('LINKFLAGS', ['-Wl,--undefined=__symbolRefDummy'])
+
+    libs = self.to_list(getattr(self, 'syms_libs', []))
+    if len(libs) == 0:
+        return
+
+    dirs = self.to_list(getattr(self, 'syms_libdirs', [])) + get_lib_paths(self.bld) + [f'{self.env.RTEMS_PATH}/{self.env.RTEMS_ARCH_RTEMS}/{self.env.RTEMS_BSP}/lib']
+    nodes = [_find_lib_node(self, x, dirs) for x in libs]
+    dirs = [x.parent.abspath() for x in nodes] + dirs
+    args = [f'-L{x}' for x in dirs] + [f'-l{x}' for x in libs]
+
+    if getattr(self, 'syms_ldep', False):
+        src = out.find_or_declare(f'{self.target}-inc-syms.c')
+        lds = out.find_or_declare(f'{self.target}.lds')
+        t = self.create_task('ldep', [self.bld.root.find_node(f'{TOOLS_DIR}/ldep.py')] + nodes, [src, lds])
+        t.env.MKSYMS_ARGS = ['-C', prefix.removesuffix('-')] + args
+        self.source.append(src)
+    else:
+        lds = out.find_or_declare(f'{self.target}-inc-syms.lds')
+        t = self.create_task('mksyms', [config, tools] + nodes, lds)
+        t.env.MKSYMS_ARGS = ['-C', prefix, '-N', '__symbolRefIncLibs', '-T', 'linker', '-a', arch, '-c', config.abspath()] + args
+
+    self.env.append_value('LINKFLAGS', [f'-Wl,-T{lds.abspath()}'])
+    self.syms_lds = lds
+
+
+@feature('rtems_syms')
+@Taskgen.after_method('apply_link', 'process_use')
+def apply_syms_stage2(self):
+    """
+    Adds the rtems-syms step and the stage 2 link after the regular (stage 1) link, see apply_mksyms.
+    Runs after process_use so stage 2 gets the same objects and library dependencies as stage 1.
+    The stage 2 executable is <target>.exe, or <target>-syms.exe if the target already ends in .exe.
+    """
+    if not self.env.RTEMS_SYMS:
+        self.env.RTEMS_SYMS = [os.path.join(os.path.dirname(self.env.CC[0]), 'rtems-syms')]
+
+    lds = getattr(self, 'syms_lds', None)
+    if lds is not None:
+        self.link_task.dep_nodes.append(lds)
+
+    stage1 = self.link_task.outputs[0]
+    intr = stage1.parent.find_or_declare(f'{stage1.name}-intr.o')
+    self.create_task('rtems_syms', stage1, [intr, stage1.parent.find_or_declare(f'{stage1.name}.map')])
+
+    # Same link as stage 1, plus the symbol table
+    stem = os.path.splitext(stage1.name)[0]
+    self.stage2_task = self.create_task(
+        self.link_task.__class__.__name__,
+        self.link_task.inputs + [intr],
+        stage1.parent.find_or_declare(f'{stem}-syms.exe' if stage1.suffix() == '.exe' else f'{stem}.exe')
+    )
+    self.stage2_task.dep_nodes = list(self.link_task.dep_nodes)
+    if getattr(self, 'install_task', None) is not None:
+        self.add_install_files(install_to=self.install_task.install_to, install_from=self.stage2_task.outputs)
+
+
+class rtems_module_link(Task):
+    """
+    Partial link (-Wl,-r) of a loadable module. Inputs are the module's objects and every library
+    that could be resolved to a file, so the module is relinked exactly when one of them changes.
+    """
+    color = 'YELLOW'
+    vars = ['CC', 'CFLAGS', 'MODULE_LIBPATHS', 'MODULE_LDFLAGS', 'MODULE_LIBS']
+
+    def run(self):
+        cmd = [self.env.CC[0], '-o', self.outputs[0].abspath(), '-nostdlib', '-Wl,-r']
+        cmd += self.env.CFLAGS
+        cmd += [f'-L{x}' for x in self.env.MODULE_LIBPATHS]
+        cmd += self.env.MODULE_LDFLAGS
+        cmd += [x.abspath() for x in self.inputs[:self.nobjs]]
+        cmd += self.env.MODULE_LIBS
+        return self.exec_command(cmd)
+
+    def __str__(self):
+        return f'Linking {self.outputs[0].name}'
+
+
+@feature('rtems_module')
+@Taskgen.after_method('process_source')
+def apply_module_link(self):
+    """
+    Links the compiled sources of this task generator into a relocatable RTEMS module (see build_module).
+    Each source is compiled by its own (cached) c task, only the final partial link is done here.
+
+    Attributes
+    ----------
+    module_ldflags : list[str]
+        Linker flags to append
+    module_libs : list[str]
+        Libraries to link against, either -l<name> or paths to the library files
+    """
+    objs = [t.outputs[0] for t in getattr(self, 'compiled_tasks', [])]
+    dirs = get_lib_paths(self.bld)
+
+    # Resolve libraries to nodes where possible, so they become dependencies of the link. The link runs
+    # from the build dir, so library files found relative to the source dir are passed as absolute paths
+    libnodes = []
+    libs = []
+    for x in self.to_list(getattr(self, 'module_libs', [])):
+        if x.startswith('-l'):
+            n = _find_lib_node(self, x.removeprefix('-l'), dirs, mandatory=False)
+            libs.append(x)
+        else:
+            n = self.path.find_node(x) if not os.path.isabs(x) else self.bld.root.find_node(x)
+            libs.append(x if n is None else n.abspath())
+        if n is not None:
+            libnodes.append(n)
+
+    self.link_task = self.create_task('rtems_module_link', objs + libnodes, self.path.find_or_declare(self.target))
+    self.link_task.nobjs = len(objs)
+    self.link_task.env.MODULE_LIBPATHS = dirs
+    self.link_task.env.MODULE_LDFLAGS = self.to_list(getattr(self, 'module_ldflags', []))
+    self.link_task.env.MODULE_LIBS = libs